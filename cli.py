@@ -8,14 +8,9 @@ sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 import argparse
 
-from src.rag.retriever import (
-    format_results,
-    search_hybrid_workflow,
-    list_collections_workflow, format_collections,
-    list_documents_workflow, format_documents,
-    progress_workflow, format_progress,
-    read_document_workflow
-)
+# Stdlib only — the RAG stack (httpx, psycopg2, pgvector, numpy) is imported lazily,
+# so a call answered by the daemon never loads it.
+from src.rag.daemon import DAEMON_COMMANDS, forward, serve
 
 
 def _shutdown(sig: int, _frame: object) -> None:
@@ -26,6 +21,26 @@ def main():
     signal.signal(signal.SIGTERM, _shutdown)
     signal.signal(signal.SIGINT, _shutdown)
 
+    parser = build_parser()
+    args = parser.parse_args()
+
+    if args.cmd == "daemon":
+        import src.rag.retriever  # noqa: F401 — warm imports before the first request
+        serve(lambda argv: run(parser.parse_args(argv)))
+        return
+
+    # Forward to a running daemon; None → no daemon, run in this process
+    if args.cmd in DAEMON_COMMANDS:
+        reply = forward(sys.argv[1:])
+        if reply is not None:
+            sys.stdout.write(reply["stdout"])
+            sys.stderr.write(reply["stderr"])
+            sys.exit(reply["code"])
+
+    run(args)
+
+
+def build_parser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser(
         prog="cli.py",
         description="RAG CLI — hybrid search over indexed document collections."
@@ -94,18 +109,28 @@ def main():
     )
     p.add_argument("project_root", help="Project root containing .rag-docs.json")
     p.add_argument("--chunk-size", dest="chunk_size", type=int, default=2000,
-                   help="Target chunk size in chars (default 2000)")
+                   help="Target chunk size in chars, tokens with CHUNK_UNIT=tokens (default 2000)")
     p.add_argument("--overlap", type=int, default=400,
-                   help="Overlap between chunks in chars (default 400)")
+                   help="Overlap between chunks in chars, tokens with CHUNK_UNIT=tokens (default 400)")
 
     # ── server ────────────────────────────────────────────────────────────────
     p = sub.add_parser("server", help="Manage GPU servers (status/start/stop/restart/tail/errors/list)")
     p.add_argument("server_args", nargs=argparse.REMAINDER, default=["status"],
                    help="action [server_name] [flags] — start|stop|restart|status|list|tail|errors")
 
-    # ── Dispatch ──────────────────────────────────────────────────────────────
-    args = parser.parse_args()
+    # ── daemon ────────────────────────────────────────────────────────────────
+    sub.add_parser(
+        "daemon",
+        help="Serve search_hybrid, list_collections, list_documents, progress and read_document "
+             "from one long-running process on a Unix socket (RAG_DAEMON_SOCKET). Other cli.py "
+             "calls forward to it while it runs and execute in-process otherwise. Foreground; stop with Ctrl-C/SIGTERM."
+    )
+
+    return parser
 
+
+# Run one parsed command in this process (also the daemon's per-request handler)
+def run(args: argparse.Namespace) -> None:
     if args.cmd == "status":
         from src.rag.status import gather, format_status
         print(format_status(gather()))
@@ -132,6 +157,15 @@ def main():
 
 
 def _dispatch(args: argparse.Namespace) -> None:
+    from src.rag.retriever import (
+        format_results,
+        search_hybrid_workflow,
+        list_collections_workflow, format_collections,
+        list_documents_workflow, format_documents,
+        progress_workflow, format_progress,
+        read_document_workflow
+    )
+
     if args.cmd == "search_hybrid":
         results = search_hybrid_workflow(
             args.query, args.collection, args.document
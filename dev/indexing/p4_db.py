@@ -1,5 +1,6 @@
 # INFRASTRUCTURE
 import logging
+import os
 
 import psycopg2
 from pgvector.psycopg2 import register_vector
@@ -12,6 +13,9 @@ DB_USER = "rag"
 DB_PASSWORD = "rag"
 SPARSE_DIMS = 30522
 RRF_K = 60
+# "halfvec" scores dense search through a float16 cast — same values as EMBEDDING_STORAGE=halfvec
+# in src/rag, so an eval run per setting compares storage precision on identical data
+EMBEDDING_STORAGE = os.getenv("EMBEDDING_STORAGE", "vector")
 
 
 # FUNCTIONS
@@ -100,14 +104,15 @@ def store_chunks(conn, chunks: list[dict], embeddings: list[list[float]], sparse
 
 # Search using dense embeddings (cosine similarity)
 def search_dense(conn, query_embedding: list[float], collection: str, top_k: int) -> list[dict]:
+    column = "embedding::halfvec" if EMBEDDING_STORAGE == "halfvec" else "embedding"
     with conn.cursor() as cur:
         cur.execute(
-            """
+            f"""
             SELECT content, collection, document, chunk_index,
-                   1 - (embedding <=> %s::vector) as score
+                   1 - ({column} <=> %s::{EMBEDDING_STORAGE}) as score
             FROM documents
             WHERE collection = %s
-            ORDER BY embedding <=> %s::vector
+            ORDER BY {column} <=> %s::{EMBEDDING_STORAGE}
             LIMIT %s
             """,
             (query_embedding, collection, query_embedding, top_k),
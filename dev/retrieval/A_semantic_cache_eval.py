@@ -0,0 +1,139 @@
+# INFRASTRUCTURE
+import json
+import sys
+from datetime import datetime
+from pathlib import Path
+
+import httpx
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent))
+sys.path.insert(0, str(Path(__file__).parent.parent / "indexing"))
+
+import p2_embedder
+from p1_retriever import INSTRUCT_PREFIX, rerank, retrieve_dense
+
+QUERIES_PATH = Path(__file__).parent / "queries_semantic_cache.json"
+REPORTS_DIR = Path(__file__).parent / "A_semantic_cache_eval_reports"
+THRESHOLDS = [0.85, 0.90, 0.92, 0.94, 0.95, 0.96, 0.97, 0.98, 0.99]
+# Production hybrid path: dense candidates → reranker → top 12 (src/rag/retriever.py)
+RERANK_CANDIDATES = 30
+TOP_K = 12
+# A served hit is correct when its top-3 chunks equal the fresh search's top-3 (as sets)
+AGREE_TOP = 3
+EMBEDDING_HEALTH_URL = "http://localhost:8081/health"
+RERANKER_HEALTH_URL = "http://localhost:8082/health"
+
+
+# ORCHESTRATOR
+
+# For every (query, paraphrase) and (query, near miss) pair: cosine of the prefixed query
+# embeddings and whether serving the query's results for the other one would be right.
+# Sweeps SEMANTIC_CACHE_THRESHOLD over the cosines — no cache code involved.
+def run_semantic_cache_eval() -> None:
+    _check_server(EMBEDDING_HEALTH_URL, "embedding")
+    _check_server(RERANKER_HEALTH_URL, "reranker")
+    data = json.loads(QUERIES_PATH.read_text())
+    collection, pairs = data["collection"], data["pairs"]
+    print(f"Loaded {len(pairs)} pairs for {collection}")
+
+    rows = []
+    for pair in pairs:
+        texts = [pair["query"], pair["paraphrase"], pair["near_miss"]]
+        vectors = _embed_normalized(texts)
+        results = [_search(text, collection) for text in texts]
+        for kind, i in (("paraphrase", 1), ("near_miss", 2)):
+            rows.append({
+                "kind": kind,
+                "query": pair["query"],
+                "other": texts[i],
+                "cosine": float(vectors[0] @ vectors[i]),
+                "agree": _agree(results[0], results[i]),
+                "overlap": _overlap(results[0], results[i]),
+            })
+    _write_report(collection, rows)
+
+
+# FUNCTIONS
+
+# Exit with a hint if a server is not healthy
+def _check_server(url: str, name: str) -> None:
+    try:
+        resp = httpx.get(url, timeout=3.0)
+        if resp.status_code != 200:
+            print(f"ERROR: {name} server unhealthy (HTTP {resp.status_code}). Run: ./start.sh")
+            sys.exit(1)
+    except Exception as e:
+        print(f"ERROR: {name} server not reachable ({e}). Run: ./start.sh")
+        sys.exit(1)
+
+
+# Instruct-prefixed full-dimension query embeddings, L2-normalized (as semantic_lookup compares them)
+def _embed_normalized(texts: list[str]) -> np.ndarray:
+    vectors = np.array(p2_embedder.embed(texts, prefix=INSTRUCT_PREFIX), dtype=np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+# Fresh dense+rerank results for query: (document, chunk_index) in rank order
+def _search(query: str, collection: str) -> list[tuple[str, int]]:
+    candidates = retrieve_dense(query, collection, top_k=RERANK_CANDIDATES)
+    return [(r["document"], r["chunk_index"]) for r in rerank(query, candidates, TOP_K)]
+
+
+# Served results are right for the other query: same top-AGREE_TOP chunks
+def _agree(served: list[tuple[str, int]], fresh: list[tuple[str, int]]) -> bool:
+    return set(served[:AGREE_TOP]) == set(fresh[:AGREE_TOP])
+
+
+# Share of the fresh top-K also in the served top-K
+def _overlap(served: list[tuple[str, int]], fresh: list[tuple[str, int]]) -> float:
+    return len(set(served) & set(fresh)) / len(fresh) if fresh else 1.0
+
+
+# Per threshold: hit rates, precision of hits (agreeing with a fresh search), mean overlap of hits
+def _sweep(rows: list[dict]) -> list[dict]:
+    paraphrases = [r for r in rows if r["kind"] == "paraphrase"]
+    near_misses = [r for r in rows if r["kind"] == "near_miss"]
+    sweep = []
+    for threshold in THRESHOLDS:
+        hits = [r for r in rows if r["cosine"] >= threshold]
+        sweep.append({
+            "threshold": threshold,
+            "paraphrase_hits": sum(r["cosine"] >= threshold for r in paraphrases),
+            "near_miss_hits": sum(r["cosine"] >= threshold for r in near_misses),
+            "hits": len(hits),
+            "precision": sum(r["agree"] for r in hits) / len(hits) if hits else None,
+            "overlap": sum(r["overlap"] for r in hits) / len(hits) if hits else None,
+        })
+    return sweep
+
+
+# Markdown report: threshold sweep, then every pair with its cosine and agreement
+def _write_report(collection: str, rows: list[dict]) -> None:
+    REPORTS_DIR.mkdir(exist_ok=True)
+    stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    n_para = sum(r["kind"] == "paraphrase" for r in rows)
+    n_near = len(rows) - n_para
+    lines = [
+        f"# Semantic cache eval — {collection} — {stamp}",
+        "",
+        f"Pairs: {n_para} paraphrases, {n_near} near misses. Served results are correct when their "
+        f"top-{AGREE_TOP} chunks equal a fresh dense+rerank search's (RERANK_CANDIDATES={RERANK_CANDIDATES}, top_k={TOP_K}).",
+        "",
+        "| threshold | paraphrase hits | near-miss hits | precision of hits | mean overlap@12 |",
+        "|---|---|---|---|---|",
+    ]
+    for s in _sweep(rows):
+        precision = "—" if s["precision"] is None else f"{s['precision']:.2f}"
+        overlap = "—" if s["overlap"] is None else f"{s['overlap']:.2f}"
+        lines.append(f"| {s['threshold']:.2f} | {s['paraphrase_hits']}/{n_para} | {s['near_miss_hits']}/{n_near} | {precision} | {overlap} |")
+    lines += ["", "| kind | cosine | top-3 agree | overlap@12 | query → other |", "|---|---|---|---|---|"]
+    for r in sorted(rows, key=lambda r: r["cosine"], reverse=True):
+        lines.append(f"| {r['kind']} | {r['cosine']:.4f} | {'yes' if r['agree'] else 'no'} | {r['overlap']:.2f} | {r['query']} → {r['other']} |")
+    path = REPORTS_DIR / f"semantic_cache_{collection}_{stamp}.md"
+    path.write_text("\n".join(lines) + "\n")
+    print(f"Report: {path}")
+
+
+if __name__ == "__main__":
+    run_semantic_cache_eval()
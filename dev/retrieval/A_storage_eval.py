@@ -0,0 +1,150 @@
+# INFRASTRUCTURE
+import json
+import statistics
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+import httpx
+
+sys.path.insert(0, str(Path(__file__).parent))
+sys.path.insert(0, str(Path(__file__).parent.parent / "indexing"))
+
+import p2_embedder
+from p1_retriever import INSTRUCT_PREFIX
+from p4_db import get_connection
+
+QUERIES_PATH = Path(__file__).parent / "queries_test_db_3.json"
+REPORTS_DIR = Path(__file__).parent / "A_storage_eval_reports"
+STORAGES = ["vector", "halfvec"]
+# Final results (top_k) and the reranker's candidate pool (RERANK_CANDIDATES) in src/rag/retriever.py
+DEPTHS = [12, 30]
+# Timed runs per query and storage, after one untimed warm-up run
+REPEATS = 5
+VECTOR_DIMENSION = 4096
+EMBEDDING_HEALTH_URL = "http://localhost:8081/health"
+
+
+# ORCHESTRATOR
+
+# Exact dense search over one collection stored as vector and as halfvec (EMBEDDING_STORAGE):
+# table size, latency per query, and how much of the vector top-K the halfvec top-K keeps.
+# Both copies are temp tables of the same rows, so only the storage type differs.
+def run_storage_eval() -> None:
+    _check_server(EMBEDDING_HEALTH_URL, "embedding")
+    data = json.loads(QUERIES_PATH.read_text())
+    collection, queries = data["collection"], data["queries"]
+    print(f"Loaded {len(queries)} queries for {collection}")
+    vectors = p2_embedder.embed([q["query"] for q in queries], prefix=INSTRUCT_PREFIX)
+
+    conn = get_connection()
+    sizes = {storage: _copy_collection(conn, collection, storage) for storage in STORAGES}
+    rows = []
+    for query, vector in zip(queries, vectors):
+        results, latencies = {}, {}
+        for storage in STORAGES:
+            results[storage], latencies[storage] = _timed_search(conn, storage, vector, max(DEPTHS))
+        rows.append({"query": query, "results": results, "latencies": latencies})
+    conn.close()
+    _write_report(collection, sizes, rows)
+
+
+# FUNCTIONS
+
+# Exit with a hint if a server is not healthy
+def _check_server(url: str, name: str) -> None:
+    try:
+        resp = httpx.get(url, timeout=3.0)
+        if resp.status_code != 200:
+            print(f"ERROR: {name} server unhealthy (HTTP {resp.status_code}). Run: ./start.sh")
+            sys.exit(1)
+    except Exception as e:
+        print(f"ERROR: {name} server not reachable ({e}). Run: ./start.sh")
+        sys.exit(1)
+
+
+# Temp table storage_<storage> with the collection's chunks, embedding stored as <storage>; returns its size in bytes
+def _copy_collection(conn, collection: str, storage: str) -> int:
+    with conn.cursor() as cur:
+        cur.execute(
+            f"""
+            CREATE TEMP TABLE storage_{storage} AS
+            SELECT document, chunk_index, embedding::{storage}({VECTOR_DIMENSION}) AS embedding
+            FROM documents WHERE collection = %s AND embedding IS NOT NULL
+            """,
+            (collection,),
+        )
+        cur.execute(f"ANALYZE storage_{storage}")
+        cur.execute(f"SELECT pg_total_relation_size('storage_{storage}')")
+        size = cur.fetchone()[0]
+    conn.commit()
+    return size
+
+
+# Exact top_k (document, chunk_index) by cosine distance, and the median wall time of REPEATS runs in ms
+def _timed_search(conn, storage: str, vector: list[float], top_k: int) -> tuple[list[tuple[str, int]], float]:
+    sql = f"""
+        SELECT document, chunk_index FROM storage_{storage}
+        ORDER BY embedding <=> %s::{storage} LIMIT %s
+    """
+    timings = []
+    with conn.cursor() as cur:
+        for run in range(REPEATS + 1):
+            start = time.perf_counter()
+            cur.execute(sql, (vector, top_k))
+            results = [tuple(row) for row in cur.fetchall()]
+            if run:
+                timings.append((time.perf_counter() - start) * 1000)
+    return results, statistics.median(timings)
+
+
+# Share of the vector top-k that the halfvec top-k also returns (exact search, so vector is the reference)
+def _overlap(row: dict, k: int) -> float:
+    reference = set(row["results"]["vector"][:k])
+    return len(reference & set(row["results"]["halfvec"][:k])) / len(reference) if reference else 1.0
+
+
+# Share of the query's expected chunks in a storage's top-k
+def _chunk_recall(row: dict, storage: str, k: int) -> float:
+    expected = {(c["document"], c["chunk_index"]) for c in row["query"].get("expected_chunks", [])}
+    return len(expected & set(row["results"][storage][:k])) / len(expected) if expected else 1.0
+
+
+# Markdown report: sizes and latency per storage, overlap and ground-truth recall per depth,
+# then every query whose halfvec results differ
+def _write_report(collection: str, sizes: dict[str, int], rows: list[dict]) -> None:
+    REPORTS_DIR.mkdir(exist_ok=True)
+    stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    lines = [
+        f"# Storage eval — {collection} — {stamp}",
+        "",
+        f"{len(rows)} queries, exact cosine search (sequential scan), median of {REPEATS} warm runs per query.",
+        "",
+        "| storage | table size | median latency (ms) | p95 latency (ms) | "
+        + " | ".join(f"expected-chunk recall@{k}" for k in DEPTHS) + " |",
+        "|---|---|---|---|" + "---|" * len(DEPTHS),
+    ]
+    for storage in STORAGES:
+        latencies = sorted(r["latencies"][storage] for r in rows)
+        p95 = latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))]
+        recalls = " | ".join(f"{statistics.mean(_chunk_recall(r, storage, k) for r in rows):.2f}" for k in DEPTHS)
+        lines.append(f"| {storage} | {sizes[storage] / 2**20:.1f} MiB | {statistics.median(latencies):.1f} | {p95:.1f} | {recalls} |")
+    lines += ["", "| depth | mean overlap (halfvec ∩ vector) | min overlap | queries identical |", "|---|---|---|---|"]
+    for k in DEPTHS:
+        overlaps = [_overlap(r, k) for r in rows]
+        identical = sum(r["results"]["vector"][:k] == r["results"]["halfvec"][:k] for r in rows)
+        lines.append(f"| {k} | {statistics.mean(overlaps):.3f} | {min(overlaps):.3f} | {identical}/{len(rows)} |")
+    lines += ["", f"## Queries whose halfvec top-{max(DEPTHS)} differs", ""]
+    differing = [r for r in rows if r["results"]["vector"] != r["results"]["halfvec"]]
+    for r in differing:
+        lines.append(f"- {r['query']['query']} — overlap@{DEPTHS[0]} {_overlap(r, DEPTHS[0]):.2f}, @{DEPTHS[-1]} {_overlap(r, DEPTHS[-1]):.2f}")
+    if not differing:
+        lines.append("*None — halfvec returns the same ranking for every query.*")
+    path = REPORTS_DIR / f"storage_{collection}_{stamp}.md"
+    path.write_text("\n".join(lines) + "\n")
+    print(f"Report: {path}")
+
+
+if __name__ == "__main__":
+    run_storage_eval()
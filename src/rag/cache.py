@@ -0,0 +1,167 @@
+# INFRASTRUCTURE
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from .server_utils import RAG_ROOT
+
+# One SQLite file shared by every CLI process (WAL: readers never block the writer).
+# Each cache layer is its own table: key TEXT → value BLOB + last_used for LRU eviction.
+CACHE_PATH = Path(os.getenv("CACHE_PATH", str(RAG_ROOT / "data" / "cache.sqlite3")))
+# Master switch for all cache layers (0 = always recompute)
+CACHE_ENABLED = os.getenv("CACHE_ENABLED", "1") == "1"
+
+_conn: sqlite3.Connection | None = None
+_tables: set[str] = set()
+_lock = threading.Lock()
+
+
+# FUNCTIONS
+
+# Stable cache key from its parts (model, prefix, query, ...)
+def cache_key(*parts: str) -> str:
+    return hashlib.sha256("\0".join(parts).encode()).hexdigest()
+
+
+# Cached value for key, or None. A hit refreshes the entry's LRU position.
+# Cache failures (locked/corrupt file) are logged and treated as misses.
+def cache_get(table: str, key: str) -> bytes | None:
+    if not CACHE_ENABLED:
+        return None
+    try:
+        with _lock:
+            conn = get_cache_connection(table)
+            row = conn.execute(f"SELECT value FROM {table} WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                conn.execute(f"UPDATE {table} SET last_used = ? WHERE key = ?", (time.time(), key))
+                conn.commit()
+    except sqlite3.Error as e:
+        logging.warning(f"Cache read failed ({table}): {e}")
+        return None
+    return row[0] if row else None
+
+
+# Store value under key, then evict least-recently-used entries beyond max_entries
+# (and beyond max_bytes of values, if given)
+def cache_put(table: str, key: str, value: bytes, max_entries: int, max_bytes: int | None = None) -> None:
+    if not CACHE_ENABLED:
+        return
+    try:
+        with _lock:
+            conn = get_cache_connection(table)
+            conn.execute(
+                f"INSERT OR REPLACE INTO {table} (key, value, last_used) VALUES (?, ?, ?)",
+                (key, value, time.time()),
+            )
+            evict(conn, table, max_entries, max_bytes)
+            conn.commit()
+    except sqlite3.Error as e:
+        logging.warning(f"Cache write failed ({table}): {e}")
+
+
+# Batch form of cache_get for one layer: {key: value} for the keys present (one transaction)
+def cache_get_many(table: str, keys: list[str]) -> dict[str, bytes]:
+    if not CACHE_ENABLED or not keys:
+        return {}
+    try:
+        with _lock:
+            conn = get_cache_connection(table)
+            marks = ",".join("?" * len(keys))
+            rows = conn.execute(f"SELECT key, value FROM {table} WHERE key IN ({marks})", keys).fetchall()
+            if rows:
+                conn.execute(f"UPDATE {table} SET last_used = ? WHERE key IN ({marks})", [time.time(), *keys])
+                conn.commit()
+    except sqlite3.Error as e:
+        logging.warning(f"Cache read failed ({table}): {e}")
+        return {}
+    return dict(rows)
+
+
+# Entries of one layer whose key starts with prefix, most recently used first (at most limit).
+# Does not refresh LRU positions — the caller touches the entry it uses (cache_touch).
+def cache_scan(table: str, prefix: str, limit: int) -> list[tuple[str, bytes]]:
+    if not CACHE_ENABLED:
+        return []
+    try:
+        with _lock:
+            conn = get_cache_connection(table)
+            return conn.execute(
+                f"SELECT key, value FROM {table} WHERE key >= ? AND key < ? ORDER BY last_used DESC LIMIT ?",
+                (prefix, prefix + "\uffff", limit),
+            ).fetchall()
+    except sqlite3.Error as e:
+        logging.warning(f"Cache read failed ({table}): {e}")
+        return []
+
+
+# Refresh key's LRU position without reading its value
+def cache_touch(table: str, key: str) -> None:
+    if not CACHE_ENABLED:
+        return
+    try:
+        with _lock:
+            conn = get_cache_connection(table)
+            conn.execute(f"UPDATE {table} SET last_used = ? WHERE key = ?", (time.time(), key))
+            conn.commit()
+    except sqlite3.Error as e:
+        logging.warning(f"Cache write failed ({table}): {e}")
+
+
+# Batch form of cache_put: store all items, then evict beyond max_entries (one transaction)
+def cache_put_many(table: str, items: dict[str, bytes], max_entries: int) -> None:
+    if not CACHE_ENABLED or not items:
+        return
+    try:
+        with _lock:
+            conn = get_cache_connection(table)
+            now = time.time()
+            conn.executemany(
+                f"INSERT OR REPLACE INTO {table} (key, value, last_used) VALUES (?, ?, ?)",
+                [(key, value, now) for key, value in items.items()],
+            )
+            evict(conn, table, max_entries)
+            conn.commit()
+    except sqlite3.Error as e:
+        logging.warning(f"Cache write failed ({table}): {e}")
+
+
+# Delete the least-recently-used rows beyond max_entries, then beyond max_bytes of values (caller commits)
+def evict(conn: sqlite3.Connection, table: str, max_entries: int, max_bytes: int | None = None) -> None:
+    excess = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0] - max_entries
+    if excess > 0:
+        conn.execute(
+            f"DELETE FROM {table} WHERE key IN (SELECT key FROM {table} ORDER BY last_used LIMIT ?)",
+            (excess,),
+        )
+    if max_bytes is None:
+        return
+    excess = conn.execute(f"SELECT COALESCE(SUM(length(value)), 0) FROM {table}").fetchone()[0] - max_bytes
+    if excess <= 0:
+        return
+    doomed = []
+    for key, size in conn.execute(f"SELECT key, length(value) FROM {table} ORDER BY last_used").fetchall():
+        if excess <= 0:
+            break
+        doomed.append((key,))
+        excess -= size
+    conn.executemany(f"DELETE FROM {table} WHERE key = ?", doomed)
+
+
+# Per-process SQLite connection (opened lazily), with the table created on first use
+def get_cache_connection(table: str) -> sqlite3.Connection:
+    global _conn
+    if _conn is None:
+        CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
+        _conn = sqlite3.connect(CACHE_PATH, timeout=5, check_same_thread=False)
+        _conn.execute("PRAGMA journal_mode=WAL")
+        _conn.execute("PRAGMA synchronous=NORMAL")
+    if table not in _tables:
+        _conn.execute(f"CREATE TABLE IF NOT EXISTS {table} (key TEXT PRIMARY KEY, value BLOB NOT NULL, last_used REAL NOT NULL)")
+        _conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_last_used ON {table}(last_used)")
+        _conn.commit()
+        _tables.add(table)
+    return _conn
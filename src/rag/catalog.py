@@ -0,0 +1,172 @@
+# FUNCTIONS
+
+# Ensure the catalog tables exist. Returns True if collection_documents was just
+# (re)created — the caller then fills its counts with rebuild_catalog.
+# The catalog doubles as the name dictionary: chunk rows carry collection_id /
+# document_id integers; names live only here (trigram-indexed for LIKE/ILIKE).
+# generation is bumped by every write to a collection's chunks (store/delete), so
+# derived artifacts (segment files, caches) can detect staleness with one PK lookup.
+# chunk_count / model / dimension and the per-document rows are maintained by the
+# same write transactions, so validate/list/progress never aggregate documents.
+def ensure_catalog(cur) -> bool:
+    cur.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS collections (
+            collection TEXT PRIMARY KEY,
+            generation BIGINT NOT NULL DEFAULT 0,
+            updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+        )
+    """)
+    # ALTER takes ACCESS EXCLUSIVE even when the column exists — only run it when one is missing
+    cur.execute("SELECT column_name FROM information_schema.columns WHERE table_name = 'collections'")
+    existing = {row[0] for row in cur.fetchall()}
+    for column, definition in [
+        ("chunk_count", "BIGINT NOT NULL DEFAULT 0"),
+        ("model", "TEXT"),
+        ("dimension", "INTEGER"),
+        ("collection_id", "INTEGER GENERATED BY DEFAULT AS IDENTITY UNIQUE"),
+    ]:
+        if column not in existing:
+            cur.execute(f"ALTER TABLE collections ADD COLUMN {column} {definition}")
+
+    # Pre-dictionary shape (keyed by collection name) holds only derived counts — recreate it
+    cur.execute("""
+        SELECT 1 FROM information_schema.columns
+        WHERE table_name = 'collection_documents' AND column_name = 'collection'
+    """)
+    if cur.fetchone():
+        cur.execute("DROP TABLE collection_documents")
+    cur.execute("SELECT to_regclass('collection_documents')")
+    exists = cur.fetchone()[0] is not None
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS collection_documents (
+            document_id INTEGER GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+            collection_id INTEGER NOT NULL,
+            document TEXT NOT NULL,
+            chunk_count INTEGER NOT NULL DEFAULT 0,
+            total_chunks INTEGER,
+            updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+            UNIQUE (collection_id, document)
+        )
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_collections_trgm ON collections USING gin (collection gin_trgm_ops)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_collection_documents_trgm ON collection_documents USING gin (document gin_trgm_ops)")
+    return not exists
+
+
+# Integer id of a collection name, creating its catalog row on first use
+def resolve_collection(cur, collection: str) -> int:
+    cur.execute("""
+        INSERT INTO collections (collection) VALUES (%s)
+        ON CONFLICT (collection) DO UPDATE SET collection = EXCLUDED.collection
+        RETURNING collection_id
+    """, (collection,))
+    return cur.fetchone()[0]
+
+
+# Integer id of a document name within a collection, creating its row (0 chunks) on first use.
+# Runs in the caller's transaction, so a failed insert batch leaves no dictionary row behind.
+def resolve_document(cur, collection_id: int, document: str) -> int:
+    cur.execute("""
+        INSERT INTO collection_documents (collection_id, document) VALUES (%s, %s)
+        ON CONFLICT (collection_id, document) DO UPDATE SET document = EXCLUDED.document
+        RETURNING document_id
+    """, (collection_id, document))
+    return cur.fetchone()[0]
+
+
+# Bump a collection's index generation. Runs in the caller's transaction —
+# commit together with the write it describes.
+def bump_generation(cur, collection: str) -> None:
+    cur.execute("""
+        INSERT INTO collections (collection, generation, updated_at)
+        VALUES (%s, 1, NOW())
+        ON CONFLICT (collection) DO UPDATE
+        SET generation = collections.generation + 1, updated_at = NOW()
+    """, (collection,))
+
+
+# Count chunks just inserted for one document (caller's transaction).
+# total_chunks keeps the largest expected count seen, like MAX(total_chunks).
+def record_chunks(cur, collection_id: int, document_id: int, added: int, total_chunks: int, model: str, dimension: int) -> None:
+    cur.execute("""
+        UPDATE collection_documents
+        SET chunk_count = chunk_count + %s,
+            total_chunks = GREATEST(total_chunks, %s),
+            updated_at = NOW()
+        WHERE document_id = %s
+    """, (added, total_chunks, document_id))
+    cur.execute("""
+        UPDATE collections
+        SET chunk_count = chunk_count + %s, model = %s, dimension = %s, updated_at = NOW()
+        WHERE collection_id = %s
+    """, (added, model, dimension, collection_id))
+
+
+# Drop the catalog row of a document whose chunks were all deleted (caller's transaction)
+def forget_document(cur, document_id: int) -> None:
+    cur.execute(
+        "DELETE FROM collection_documents WHERE document_id = %s RETURNING collection_id, chunk_count",
+        (document_id,),
+    )
+    row = cur.fetchone()
+    if row:
+        cur.execute(
+            "UPDATE collections SET chunk_count = GREATEST(chunk_count - %s, 0), updated_at = NOW() WHERE collection_id = %s",
+            (row[1], row[0]),
+        )
+
+
+# Empty a dropped collection. The row itself stays so its generation keeps increasing —
+# a recreated collection must not reuse generations a stale segment/cache may hold.
+def forget_collection(cur, collection: str) -> None:
+    cur.execute("""
+        DELETE FROM collection_documents
+        WHERE collection_id = (SELECT collection_id FROM collections WHERE collection = %s)
+    """, (collection,))
+    cur.execute("UPDATE collections SET chunk_count = 0, updated_at = NOW() WHERE collection = %s", (collection,))
+
+
+# Recompute all counts from documents (one full scan) — bootstrap and repair.
+# Dictionary rows are updated in place (chunk rows reference their ids); rows
+# without chunks are removed.
+def rebuild_catalog(cur) -> int:
+    cur.execute("""
+        UPDATE collection_documents cd
+        SET chunk_count = COALESCE(s.chunk_count, 0), total_chunks = s.total_chunks, updated_at = NOW()
+        FROM collection_documents base
+        LEFT JOIN (
+            SELECT document_id, COUNT(*) AS chunk_count, MAX(total_chunks) AS total_chunks
+            FROM documents
+            GROUP BY document_id
+        ) s ON s.document_id = base.document_id
+        WHERE cd.document_id = base.document_id
+    """)
+    cur.execute("DELETE FROM collection_documents WHERE chunk_count = 0")
+    cur.execute("""
+        UPDATE collections c
+        SET chunk_count = COALESCE(
+            (SELECT SUM(chunk_count) FROM collection_documents cd WHERE cd.collection_id = c.collection_id), 0
+        ), updated_at = NOW()
+    """)
+    cur.execute("SELECT COUNT(*) FROM collection_documents")
+    return cur.fetchone()[0]
+
+
+# Current index generation of a collection (0 if it has never been written)
+def get_generation(conn, collection: str) -> int:
+    with conn.cursor() as cur:
+        cur.execute("SELECT generation FROM collections WHERE collection = %s", (collection,))
+        row = cur.fetchone()
+    return row[0] if row else 0
+
+
+# Cache tag for everything a search can see: the collection's generation, or — for an
+# unscoped search — every collection's generation. Any chunk write changes the tag.
+def generation_tag(conn, collection: str | None) -> str:
+    if collection:
+        return str(get_generation(conn, collection))
+    with conn.cursor() as cur:
+        cur.execute("SELECT collection, generation FROM collections ORDER BY collection")
+        rows = cur.fetchall()
+    return ",".join(f"{name}:{generation}" for name, generation in rows)
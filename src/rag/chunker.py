@@ -1,6 +1,9 @@
 # INFRASTRUCTURE
 import logging
+import os
+import re
 from pathlib import Path
+from typing import Callable, Iterable, Iterator
 
 LOG_DIR = Path(__file__).parent / "logs"
 LOG_DIR.mkdir(exist_ok=True)
@@ -13,6 +16,14 @@ logging.basicConfig(
 
 DEFAULT_CHUNK_SIZE = 2000
 DEFAULT_OVERLAP = 400
+# Unit of chunk_size / overlap: "chars", or "tokens" of the embedding model (tokenizer.py —
+# exact while the embedding server runs, estimated from chars otherwise)
+CHUNK_UNIT = os.getenv("CHUNK_UNIT", "chars")
+# Token mode: a text with more chars than chunk_size * this is split without asking the
+# tokenizer (a too-generous cut only yields smaller splits, which the merge step rejoins)
+MAX_CHARS_PER_TOKEN = 8
+
+_NON_SPACE = re.compile(r"\S")   # same whitespace as str.strip()
 
 
 # ORCHESTRATOR
@@ -22,7 +33,7 @@ def chunk_workflow(
     overlap: int = DEFAULT_OVERLAP
 ) -> list[dict]:
     content = load_file(file_path)
-    chunks = chunk_semantic(content, chunk_size, overlap)
+    chunks = chunk_semantic(content, chunk_size, overlap, length_function(CHUNK_UNIT, chunk_size))
     enriched = enrich_chunks(chunks, file_path)
     logging.info(f"Chunked {file_path}: {len(enriched)} chunks")
     return enriched
@@ -36,71 +47,122 @@ def load_file(file_path: str) -> str:
         return f.read()
 
 
-# Chunk by semantic boundaries (paragraphs, sentences)
-def chunk_semantic(content: str, chunk_size: int, overlap: int) -> list[str]:
-    separators = ["\n\n", "\n", ". ", "! ", "? ", " "]
-    splits = recursive_split(content, separators, chunk_size)
-    return merge_with_overlap(splits, chunk_size, overlap)
+# Size measure for chunk_size / overlap: len, or a token counter for CHUNK_UNIT=tokens
+def length_function(unit: str, chunk_size: int) -> Callable[[str], int]:
+    if unit != "tokens":
+        return len
+    from .tokenizer import count_tokens
 
+    def tokens(text: str) -> int:
+        if len(text) > chunk_size * MAX_CHARS_PER_TOKEN:
+            return len(text)
+        return count_tokens(text)
+    return tokens
 
-# Recursively split text using hierarchical separators
-def recursive_split(text: str, separators: list[str], chunk_size: int) -> list[str]:
-    if len(text) <= chunk_size:
-        return [text] if text.strip() else []
 
-    if not separators:
-        return [text[i:i+chunk_size] for i in range(0, len(text), chunk_size) if text[i:i+chunk_size].strip()]
+# Chunk by semantic boundaries (paragraphs, sentences). Works on offsets into `content`:
+# split_spans yields pieces lazily, merge_spans copies text only for emitted chunks.
+def chunk_semantic(content: str, chunk_size: int, overlap: int, length: Callable[[str], int] = len) -> list[str]:
+    separators = ["\n\n", "\n", ". ", "! ", "? ", " "]
+    size = (lambda start, end: end - start) if length is len else (lambda start, end: length(content[start:end]))
+    spans = split_spans(content, 0, len(content), separators, chunk_size, size)
+    return list(merge_spans(content, spans, chunk_size, overlap, length))
 
-    sep = separators[0]
-    remaining_seps = separators[1:]
 
-    parts = text.split(sep)
-    result = []
+# Split text[start:end] at hierarchical separators until every piece fits chunk_size;
+# yields (start, end) offsets in text order. Pieces keep their trailing separator;
+# whitespace-only text is dropped only where it fits as a whole or as a hard-split slice.
+def split_spans(text: str, start: int, end: int, separators: list[str], chunk_size: int,
+                size: Callable[[int, int], int]) -> Iterator[tuple[int, int]]:
+    if size(start, end) <= chunk_size:
+        if _NON_SPACE.search(text, start, end):
+            yield start, end
+        return
 
-    for i, part in enumerate(parts):
-        if i < len(parts) - 1:
-            part = part + sep
+    if not separators:
+        for i in range(start, end, chunk_size):
+            j = min(i + chunk_size, end)
+            if _NON_SPACE.search(text, i, j):
+                yield i, j
+        return
 
-        if len(part) <= chunk_size:
-            result.append(part)
+    sep = separators[0]
+    pos = start
+    while True:
+        found = text.find(sep, pos, end)
+        stop = end if found == -1 else found + len(sep)
+        if size(pos, stop) <= chunk_size:
+            yield pos, stop
         else:
-            result.extend(recursive_split(part, remaining_seps, chunk_size))
-
-    return result
-
+            yield from split_spans(text, pos, stop, separators[1:], chunk_size, size)
+        if found == -1:
+            return
+        pos = stop
+
+
+# Merge split spans into chunks with overlap. The current chunk is a list of spans (adjacent
+# ones coalesced, so usually one); `size` tracks its length as the sum of its pieces (exact
+# for len; token counts of adjacent pieces add up to within a token or two).
+def merge_spans(text: str, spans: Iterable[tuple[int, int]], chunk_size: int, overlap: int,
+                length: Callable[[str], int] = len) -> Iterator[str]:
+    current: list[tuple[int, int]] = []
+    chars = 0
+    size = 0
+
+    for start, end in spans:
+        split_size = end - start if length is len else length(text[start:end])
+        if size + split_size > chunk_size:
+            chunk = join_spans(text, current).strip()
+            if chunk:
+                yield chunk
+            # Overlap is cut in chars: token mode converts it at the chunk's chars/token ratio
+            overlap_chars = overlap if length is len else overlap * chars // max(size, 1)
+            current = word_aligned_overlap(text, current, chars, overlap_chars)
+            chars = sum(e - s for s, e in current)
+            size = chars if length is len else length(join_spans(text, current))
+        if current and current[-1][1] == start:
+            current[-1] = (current[-1][0], end)
+        else:
+            current.append((start, end))
+        chars += end - start
+        size += split_size
 
-# Get overlap text aligned to word boundary
-def get_word_aligned_overlap(text: str, overlap: int) -> str:
-    if not text or overlap <= 0:
-        return ""
-    raw = text[-overlap:]
-    space_idx = raw.find(" ")
-    if space_idx != -1 and space_idx < len(raw) - 1:
-        return raw[space_idx + 1:]
-    return raw
+    chunk = join_spans(text, current).strip()
+    if chunk:
+        yield chunk
 
 
-# Merge small splits into chunks with overlap
-def merge_with_overlap(splits: list[str], chunk_size: int, overlap: int) -> list[str]:
-    if not splits:
+# Spans of the overlap carried into the next chunk: the last `overlap` chars of the
+# current chunk, starting after their first space (unless that space is the last char)
+def word_aligned_overlap(text: str, spans: list[tuple[int, int]], chars: int, overlap: int) -> list[tuple[int, int]]:
+    if not chars or overlap <= 0:
         return []
-
-    chunks = []
-    current = ""
-
-    for split in splits:
-        if len(current) + len(split) <= chunk_size:
-            current += split
-        else:
-            if current.strip():
-                chunks.append(current.strip())
-            overlap_text = get_word_aligned_overlap(current, overlap)
-            current = overlap_text + split
-
-    if current.strip():
-        chunks.append(current.strip())
-
-    return chunks
+    keep = min(overlap, chars)
+    tail = tail_spans(spans, keep)
+    offset = 0
+    for start, end in tail:
+        space = text.find(" ", start, end)
+        if space != -1:
+            offset += space - start
+            return tail_spans(tail, keep - offset - 1) if offset < keep - 1 else tail
+        offset += end - start
+    return tail
+
+
+# The spans covering the last n chars of spans
+def tail_spans(spans: list[tuple[int, int]], n: int) -> list[tuple[int, int]]:
+    tail: list[tuple[int, int]] = []
+    for start, end in reversed(spans):
+        if n <= 0:
+            break
+        tail.append((max(start, end - n), end))
+        n -= end - start
+    return tail[::-1]
+
+
+# Text of a list of spans
+def join_spans(text: str, spans: list[tuple[int, int]]) -> str:
+    return "".join(text[start:end] for start, end in spans)
 
 
 # Add metadata to chunks
@@ -0,0 +1,118 @@
+# INFRASTRUCTURE
+# Stdlib only — cli.py imports this before deciding whether to load the RAG stack at all.
+import contextlib
+import io
+import json
+import logging
+import os
+import signal
+import socket
+import socketserver
+import time
+import traceback
+from pathlib import Path
+from typing import Callable
+
+from .lock import LOCK_DIR
+
+DAEMON_SOCKET = Path(os.getenv("RAG_DAEMON_SOCKET", str(LOCK_DIR / "daemon.sock"))).expanduser()
+# Client side: forward to a running daemon (0 = always run in-process)
+DAEMON_ENABLED = os.getenv("RAG_DAEMON", "1") == "1"
+# Short read-only workflows the daemon serves. delete / update_docs (long writes,
+# cwd-relative paths), status and server always run in the calling process.
+DAEMON_COMMANDS = {"search_hybrid", "list_collections", "list_documents", "progress", "read_document"}
+# Connecting to a live socket is immediate; anything slower means no daemon
+CONNECT_TIMEOUT = 0.5
+
+
+# ORCHESTRATOR
+
+# Serve cli commands on DAEMON_SOCKET until SIGTERM/SIGINT. handler(argv) runs one command
+# exactly as cli.py would (lock, dispatch, print); its stdout/stderr/exit code go back to
+# the client. Requests are handled one at a time in this process, so imports, the cache
+# connection and module-level state stay warm between calls.
+def serve(handler: Callable[[list[str]], None]) -> None:
+    if daemon_running():
+        raise SystemExit(f"Error: daemon already running on {DAEMON_SOCKET}")
+    DAEMON_SOCKET.parent.mkdir(parents=True, exist_ok=True)
+    DAEMON_SOCKET.unlink(missing_ok=True)   # stale socket of a killed daemon
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self) -> None:
+            line = self.rfile.readline()
+            if not line:   # daemon_running() probe
+                return
+            request = json.loads(line)
+            start = time.monotonic()
+            reply = run_captured(handler, request["argv"])
+            logging.info(f"daemon: {request['argv'][0]} → {reply['code']} in {time.monotonic() - start:.3f}s")
+            self.wfile.write(json.dumps(reply).encode() + b"\n")
+
+    # KeyboardInterrupt, not SystemExit: run_captured turns SystemExit into a command's exit code
+    def stop(_sig: int, _frame: object) -> None:
+        raise KeyboardInterrupt
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    server = socketserver.UnixStreamServer(str(DAEMON_SOCKET), Handler)
+    os.chmod(DAEMON_SOCKET, 0o600)
+    print(f"RAG daemon listening on {DAEMON_SOCKET} (PID {os.getpid()})", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        DAEMON_SOCKET.unlink(missing_ok=True)
+
+
+# Run argv on a running daemon: {"stdout", "stderr", "code"}, or None when no daemon
+# answers (not started, socket stale, died mid-request) — the caller then runs in-process.
+def forward(argv: list[str]) -> dict | None:
+    if not DAEMON_ENABLED or not DAEMON_SOCKET.exists():
+        return None
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(CONNECT_TIMEOUT)
+            sock.connect(str(DAEMON_SOCKET))
+            sock.settimeout(None)   # a search may wait on a GPU server cold start
+            sock.sendall(json.dumps({"argv": argv}).encode() + b"\n")
+            with sock.makefile("rb") as f:
+                line = f.readline()
+        return json.loads(line)
+    except (OSError, ValueError):
+        return None
+
+
+# FUNCTIONS
+
+# Call handler(argv) with stdout/stderr captured; SystemExit and errors become the exit code
+def run_captured(handler: Callable[[list[str]], None], argv: list[str]) -> dict:
+    out, err = io.StringIO(), io.StringIO()
+    code = 0
+    with contextlib.redirect_stdout(out), contextlib.redirect_stderr(err):
+        try:
+            handler(argv)
+        except SystemExit as e:
+            if isinstance(e.code, str):
+                print(e.code, file=err)
+                code = 1
+            else:
+                code = e.code or 0
+        except Exception:
+            traceback.print_exc(file=err)
+            code = 1
+    return {"stdout": out.getvalue(), "stderr": err.getvalue(), "code": code}
+
+
+# True if a daemon accepts connections on DAEMON_SOCKET
+def daemon_running() -> bool:
+    if not DAEMON_SOCKET.exists():
+        return False
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(CONNECT_TIMEOUT)
+            sock.connect(str(DAEMON_SOCKET))
+        return True
+    except OSError:
+        return False
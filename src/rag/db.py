@@ -1,7 +1,13 @@
 # INFRASTRUCTURE
+import atexit
+import logging
 import os
+import threading
+import time
+import weakref
 
 import psycopg2
+import psycopg2.extensions
 from pgvector.psycopg2 import register_vector
 from dotenv import load_dotenv
 
@@ -12,23 +18,73 @@ POSTGRES_PORT = os.getenv("POSTGRES_PORT", "5433")
 POSTGRES_USER = os.getenv("POSTGRES_USER", "rag")
 POSTGRES_PASSWORD = os.getenv("POSTGRES_PASSWORD", "rag")
 POSTGRES_DB = os.getenv("POSTGRES_DB", "rag")
+# Idle connections kept per process for reuse by the next get_connection (0 = no pooling)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "4"))
+# Idle connections older than this (seconds) are closed instead of reused
+DB_POOL_MAX_IDLE = float(os.getenv("DB_POOL_MAX_IDLE", "300"))
+
+# statement_timeout / lock_timeout (ms) per purpose — see get_connection
+_TIMEOUTS = {
+    "read":  {"stmt": 10_000,  "lock": 5_000},
+    "write": {"stmt": 120_000, "lock": 10_000},
+    "ddl":   {"stmt": 300_000, "lock": 30_000},
+}
+
+_idle: list[tuple[float, "PooledConnection"]] = []
+_idle_lock = threading.Lock()
+# Every open connection of this process (idle or checked out) — detached in a forked child
+_live: "weakref.WeakSet[PooledConnection]" = weakref.WeakSet()
+
+
+# psycopg2 connection whose close() hands it back to the pool instead of disconnecting,
+# so every existing `conn = get_connection(...) ... conn.close()` call site pools unchanged.
+class PooledConnection(psycopg2.extensions.connection):
+    _pooled = False
+
+    def close(self) -> None:
+        if not self._pooled:
+            release(self)
+
+    # Really disconnect (evicted, broken, or pool full)
+    def discard(self) -> None:
+        self._pooled = True
+        super().close()
 
 
 # FUNCTIONS
 
-# Get PostgreSQL connection.
+# Get PostgreSQL connection — reused from the per-process pool when one is idle.
 # purpose controls statement_timeout + lock_timeout:
 #   "read"  — short-lived queries (SELECT, progress checks)      10s / 5s
 #   "write" — batch inserts, deletes                             120s / 10s
 #   "ddl"   — schema creation, CREATE INDEX                     300s / 30s
+# The profile is SET (session level) on every checkout, in autocommit so a caller's
+# rollback cannot undo it; that round trip doubles as the health check — a dead idle
+# connection is discarded and the next one (or a fresh connect) is tried.
+# conn.close() returns the connection: rolled back and reset() (set_session, SETs) first.
 def get_connection(purpose: str = "read", autocommit: bool = False):
-    _timeouts = {
-        "read":  {"stmt": 10_000,  "lock": 5_000},
-        "write": {"stmt": 120_000, "lock": 10_000},
-        "ddl":   {"stmt": 300_000, "lock": 30_000},
-    }
-    t = _timeouts.get(purpose, _timeouts["read"])
-    options = f"-c statement_timeout={t['stmt']} -c lock_timeout={t['lock']}"
+    t = _TIMEOUTS.get(purpose, _TIMEOUTS["read"])
+    while True:
+        conn = checkout()
+        fresh = conn is None
+        if fresh:
+            conn = connect()
+        try:
+            conn.autocommit = True
+            with conn.cursor() as cur:
+                cur.execute(f"SET statement_timeout = {t['stmt']}; SET lock_timeout = {t['lock']}")
+            conn.autocommit = autocommit
+            conn._pooled = False
+            return conn
+        except psycopg2.Error as e:
+            conn.discard()
+            if fresh:
+                raise
+            logging.info(f"Discarded broken pooled connection: {e}")
+
+
+# Open a new physical connection (pgvector types registered once, outside any transaction)
+def connect() -> PooledConnection:
     conn = psycopg2.connect(
         host=POSTGRES_HOST,
         port=POSTGRES_PORT,
@@ -36,63 +92,130 @@ def get_connection(purpose: str = "read", autocommit: bool = False):
         password=POSTGRES_PASSWORD,
         dbname=POSTGRES_DB,
         connect_timeout=5,
-        options=options,
+        connection_factory=PooledConnection,
     )
-    if autocommit:
-        conn.autocommit = True
+    conn.autocommit = True
     register_vector(conn)
+    _live.add(conn)
     return conn
 
 
-# Validate that collection exists in database
+# Most recently returned idle connection, or None. Expired ones are closed on the way.
+def checkout() -> PooledConnection | None:
+    with _idle_lock:
+        while _idle:
+            returned_at, conn = _idle.pop()
+            if time.monotonic() - returned_at <= DB_POOL_MAX_IDLE and not conn.closed:
+                return conn
+            conn.discard()
+    return None
+
+
+# Take a connection back: roll back, reset session state, park it (or close when full/broken)
+def release(conn: PooledConnection) -> None:
+    conn._pooled = True
+    if conn.closed:
+        return
+    try:
+        conn.reset()
+    except psycopg2.Error:
+        conn.discard()
+        return
+    with _idle_lock:
+        if len(_idle) < DB_POOL_SIZE:
+            _idle.append((time.monotonic(), conn))
+            return
+    conn.discard()
+
+
+# Fork child: the parent's connections share its sockets. Point each inherited socket fd at
+# /dev/null, so nothing the child does with them — reset, close, or the Terminate message
+# psycopg2 sends when the object is garbage-collected — reaches the parent's sessions.
+# The child starts with an empty pool and connects on its own.
+def _detach_after_fork() -> None:
+    global _idle_lock, _live
+    devnull = os.open(os.devnull, os.O_RDWR)
+    try:
+        for conn in list(_live):
+            if not conn.closed:
+                os.dup2(devnull, conn.fileno())
+    finally:
+        os.close(devnull)
+    _idle.clear()
+    _idle_lock = threading.Lock()   # may have been held by another thread at fork time
+    _live = weakref.WeakSet()
+
+
+# Close all idle connections (process exit; also usable after a DB restart)
+def close_pool() -> None:
+    with _idle_lock:
+        while _idle:
+            _idle.pop()[1].discard()
+
+
+atexit.register(close_pool)
+os.register_at_fork(after_in_child=_detach_after_fork)
+
+
+# Validate that collection exists in database (catalog PK lookup; the full list is only read on failure)
 def validate_collection(conn, collection: str):
-    existing = [r['collection'] for r in query_collections(conn)]
-    if collection not in existing:
+    with conn.cursor() as cur:
+        cur.execute("SELECT chunk_count FROM collections WHERE collection = %s", (collection,))
+        row = cur.fetchone()
+    if not row or row[0] == 0:
+        existing = [r['collection'] for r in query_collections(conn)]
         raise ValueError(f"Collection '{collection}' not found. Available: {', '.join(existing)}")
 
 
-# Add document filter clause (LIKE if value contains %, else exact match).
+# Add collection filter clause on a collection_id-keyed table (documents, chunk_vectors).
+# The name is resolved through the catalog in-query; the planner prunes partitions at run time.
+# Returns new (where_clauses, where_params) lists — does not mutate arguments.
+def add_collection_filter(where_clauses: list, where_params: list, collection: str) -> tuple[list, list]:
+    clause = "collection_id = (SELECT collection_id FROM collections WHERE collection = %s)"
+    return where_clauses + [clause], where_params + [collection]
+
+
+# Add document filter clause (LIKE if value contains %, else exact match) on a
+# document_id-keyed table — matched against the trigram-indexed catalog names.
 # Returns new (where_clauses, where_params) lists — does not mutate arguments.
 def add_document_filter(where_clauses: list, where_params: list, document: str) -> tuple[list, list]:
-    clause = "document LIKE %s" if '%' in document else "document = %s"
+    match = "document LIKE %s" if '%' in document else "document = %s"
+    clause = f"document_id IN (SELECT document_id FROM collection_documents WHERE {match})"
     return where_clauses + [clause], where_params + [document]
 
 
-# Query all collections with chunk counts. filter: case-insensitive substring match on name.
+# Query all collections with chunk counts from the catalog. filter: case-insensitive substring match on name.
 def query_collections(conn, filter: str | None = None) -> list[dict]:
-    where_clauses = []
+    where_clauses = ["chunk_count > 0"]
     where_params = []
     if filter:
         where_clauses.append("collection ILIKE %s")
         where_params.append(f"%{filter}%")
-    where_sql = f"WHERE {' AND '.join(where_clauses)}" if where_clauses else ""
     with conn.cursor() as cur:
         cur.execute(f"""
-            SELECT collection, COUNT(*) as chunk_count
-            FROM documents
-            {where_sql}
-            GROUP BY collection
+            SELECT collection, chunk_count
+            FROM collections
+            WHERE {' AND '.join(where_clauses)}
             ORDER BY collection
         """, where_params)
         rows = cur.fetchall()
     return [{"collection": row[0], "chunks": row[1]} for row in rows]
 
 
-# Query all documents in a collection with chunk counts
+# Query all documents in a collection with chunk counts (catalog, PK prefix scan)
 def query_documents(conn, collection: str, document: str | None = None, filter: str | None = None) -> list[dict]:
-    where_clauses = ["collection = %s"]
-    where_params = [collection]
+    where_clauses, where_params = add_collection_filter([], [], collection)
     if document:
-        where_clauses, where_params = add_document_filter(where_clauses, where_params, document)
+        where_clauses.append("document LIKE %s" if '%' in document else "document = %s")
+        where_params.append(document)
     if filter:
         where_clauses.append("document ILIKE %s")
         where_params.append(f"%{filter}%")
     with conn.cursor() as cur:
         cur.execute(f"""
-            SELECT document, COUNT(*) as chunk_count
-            FROM documents
+            SELECT document, chunk_count
+            FROM collection_documents
             WHERE {' AND '.join(where_clauses)}
-            GROUP BY document
             ORDER BY document
         """, where_params)
         rows = cur.fetchall()
@@ -102,19 +225,17 @@ def query_documents(conn, collection: str, document: str | None = None, filter:
 # Query indexing progress per document in a collection.
 # Returns rows of {"document", "done", "total"} where:
 #   done  = chunks currently in the documents table for this (collection, document)
-#   total = expected chunk count (from the per-row total_chunks column)
+#   total = expected chunk count (largest per-row total_chunks stored)
+# Both come from the collection_documents catalog, kept in step by store/delete.
 # A document with done < total is in progress; done == total is fully indexed.
 # Documents that haven't started indexing won't appear.
 def query_progress(conn, collection: str) -> list[dict]:
     with conn.cursor() as cur:
         cur.execute(
             """
-            SELECT document,
-                   COUNT(*)            AS done,
-                   MAX(total_chunks)   AS total
-            FROM documents
-            WHERE collection = %s
-            GROUP BY document
+            SELECT document, chunk_count AS done, total_chunks AS total
+            FROM collection_documents
+            WHERE collection_id = (SELECT collection_id FROM collections WHERE collection = %s)
             ORDER BY document
             """,
             (collection,),
@@ -128,13 +249,33 @@ def fetch_chunk_range(conn, collection: str, document: str, start_idx: int, end_
     with conn.cursor() as cur:
         cur.execute(
             """
-            SELECT content, chunk_index
-            FROM documents
-            WHERE collection = %s AND document = %s
-              AND chunk_index BETWEEN %s AND %s
-            ORDER BY chunk_index
+            SELECT d.content, d.chunk_index
+            FROM documents d
+            JOIN collection_documents cd ON cd.document_id = d.document_id
+            JOIN collections c ON c.collection_id = cd.collection_id
+            WHERE c.collection = %s AND cd.document = %s
+              AND d.collection_id = c.collection_id
+              AND d.chunk_index BETWEEN %s AND %s
+            ORDER BY d.chunk_index
             """,
             (collection, document, start_idx, end_idx)
         )
         rows = cur.fetchall()
     return [{"content": row[0], "chunk_index": row[1]} for row in rows]
+
+
+# Fetch chunks of one collection by id (content fetch for final top-k hits)
+def fetch_chunks_by_id(conn, collection: str, ids: list[int]) -> list[dict]:
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            SELECT d.id, d.content, cd.document, d.chunk_index
+            FROM documents d
+            JOIN collection_documents cd ON cd.document_id = d.document_id
+            WHERE d.collection_id = (SELECT collection_id FROM collections WHERE collection = %s)
+              AND d.id = ANY(%s)
+            """,
+            (collection, ids)
+        )
+        rows = cur.fetchall()
+    return [{"id": row[0], "content": row[1], "document": row[2], "chunk_index": row[3]} for row in rows]
@@ -1,13 +1,18 @@
 # INFRASTRUCTURE
+import base64
 import logging
 import os
+import threading
 from pathlib import Path
 from typing import Union
 
-import httpx
+import numpy as np
 from dotenv import load_dotenv
 
-from .server_manager import ensure_ready, find_server_url, _touch_state_file
+from .http_clients import post_json
+from .server_manager import ensure_ready, find_server_url, served_model, _touch_state_file
+from .server_utils import class_context
+from .tokenizer import count_tokens, truncate_tokens
 
 load_dotenv()
 
@@ -20,24 +25,67 @@ logging.basicConfig(
     format='%(asctime)s - %(levelname)s - %(message)s'
 )
 
+# Model name sent with each request and recorded per collection; also the cache identity of an
+# external EMBEDDING_URL server (embedding_identity) — rename it when that server's model changes
 EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "Qwen3-Embedding-8B")
-MAX_TOKENS = 4000
-CHARS_PER_TOKEN = 3
+# Tokens per embedding input: the embedding presets' -c (one slot, -np 1). The server rejects
+# longer inputs, so texts are cut to this minus the prefix and SPECIAL_TOKENS (max_input_tokens).
+# Set it for an external server (EMBEDDING_URL) with a different context.
+EMBEDDING_CONTEXT = int(os.getenv("EMBEDDING_CONTEXT", str(class_context("embedding") or 2048)))
+# BOS/EOS the server adds around every input
+SPECIAL_TOKENS = 2
+# Wire format requested from /v1/embeddings: "base64" (packed float32, decoded straight into
+# numpy) or "float" (JSON decimal floats). Servers that ignore encoding_format still work.
+EMBEDDING_ENCODING = os.getenv("EMBEDDING_ENCODING", "base64")
+# Token budget per /v1/embeddings request on the indexing path (embed_packed). Matches the
+# presets' -b/-ub 4096, so the server evaluates a packed request without splitting it.
+EMBED_BATCH_TOKENS = int(os.getenv("EMBED_BATCH_TOKENS", "4096"))
+
+# Pipeline embed workers call embed_workflow concurrently — one of them starts the server
+_ready_lock = threading.Lock()
 
 
 # ORCHESTRATOR
-def embed_workflow(texts: Union[str, list[str]], prefix: str | None = None) -> list[list[float]]:
-    ensure_ready("embedding")
+def embed_workflow(texts: Union[str, list[str]], prefix: str | None = None) -> list[np.ndarray | None]:
+    with _ready_lock:
+        ensure_ready("embedding")
     if isinstance(texts, str):
         texts = [texts]
-    texts = [truncate_to_max_tokens(t, MAX_TOKENS) for t in texts]
+    limit = max_input_tokens(prefix)
+    texts = [truncate_to_max_tokens(t, limit) for t in texts]
     embeddings = generate_embeddings(texts, prefix)
     logging.info(f"Embedded {len(texts)} texts")
     return embeddings
 
 
+# Embed a window of texts in token-budget requests instead of one request per fixed-size
+# batch. Requests are formed by pack_batches over real token counts (server started first,
+# so /tokenize answers); embeddings come back in input order.
+def embed_packed(texts: list[str], prefix: str | None = None) -> list[np.ndarray | None]:
+    with _ready_lock:
+        ensure_ready("embedding")
+    limit = max_input_tokens(prefix)
+    # Every input costs its (truncated) text plus the prefix and BOS/EOS: EMBEDDING_CONTEXT - limit
+    overhead = EMBEDDING_CONTEXT - limit
+    lengths = [min(count_tokens(t), limit) + overhead for t in texts]
+    embeddings: list[np.ndarray | None] = [None] * len(texts)
+    for group in pack_batches(lengths, EMBED_BATCH_TOKENS):
+        for i, embedding in zip(group, embed_workflow([texts[i] for i in group], prefix)):
+            embeddings[i] = embedding
+    return embeddings
+
+
 # FUNCTIONS
 
+# Identity of the vectors embed_workflow returns, for embedding cache keys: the served model
+# (server_manager.served_model — GGUF stem of the local server EMBEDDING_URL points at, else of
+# the running / default variant; EMBEDDING_MODEL for an external server) and EMBEDDING_CONTEXT,
+# which decides where long inputs are cut. Config and state files only, no request.
+def embedding_identity() -> str:
+    model = served_model("embedding", os.getenv("EMBEDDING_URL")) or EMBEDDING_MODEL
+    return f"{model}@{EMBEDDING_CONTEXT}"
+
+
 # Resolve embedding URL: env override → state-file discovery → error
 def _embedding_url() -> str:
     env = os.getenv("EMBEDDING_URL")
@@ -51,26 +99,59 @@ def _embedding_url() -> str:
     return f"{base}/v1/embeddings"
 
 
-# Truncate text to approximate max tokens
+# Group text indices into requests of at most `budget` tokens: first-fit over lengths in
+# descending order, so short texts fill the gaps next to long ones. A text over the budget
+# gets a request of its own. Each group lists its indices in input order.
+def pack_batches(lengths: list[int], budget: int) -> list[list[int]]:
+    groups: list[list[int]] = []
+    used: list[int] = []
+    for i in sorted(range(len(lengths)), key=lambda i: -lengths[i]):
+        for g, total in enumerate(used):
+            if total + lengths[i] <= budget:
+                groups[g].append(i)
+                used[g] += lengths[i]
+                break
+        else:
+            groups.append([i])
+            used.append(lengths[i])
+    return [sorted(group) for group in groups]
+
+
+# Tokens left for the text itself once prefix and special tokens share the input's context
+def max_input_tokens(prefix: str | None) -> int:
+    return EMBEDDING_CONTEXT - SPECIAL_TOKENS - (count_tokens(prefix) if prefix else 0)
+
+
+# Truncate text to max_tokens tokens of the embedding model (tokenizer.py)
 def truncate_to_max_tokens(text: str, max_tokens: int) -> str:
-    max_chars = max_tokens * CHARS_PER_TOKEN
-    if len(text) <= max_chars:
-        return text
-    logging.warning(f"Truncated text from {len(text)} to {max_chars} chars (~{max_tokens} tokens)")
-    return text[:max_chars]
+    truncated = truncate_tokens(text, max_tokens)
+    if truncated != text:
+        logging.warning(f"Truncated text from {len(text)} to {len(truncated)} chars ({max_tokens} tokens)")
+    return truncated
 
 
-# Generate embeddings via llama-server API
-def generate_embeddings(texts: list[str], prefix: str | None = None) -> list[list[float]]:
+# Generate embeddings via llama-server API (float32 arrays; None for a NULL vector)
+def generate_embeddings(texts: list[str], prefix: str | None = None) -> list[np.ndarray | None]:
     if prefix:
         texts = [f"{prefix}{t}" for t in texts]
     url = _embedding_url()
     _touch_state_file(int(url.split(":")[2].split("/")[0]))
-    response = httpx.post(
-        url,
-        json={"input": texts, "model": EMBEDDING_MODEL},
-        timeout=300.0
-    )
+    payload = {"input": texts, "model": EMBEDDING_MODEL}
+    if EMBEDDING_ENCODING == "base64":
+        payload["encoding_format"] = "base64"
+    response = post_json("embedding", url, payload, timeout=300.0)
     response.raise_for_status()
     data = response.json()
-    return [item["embedding"] for item in data["data"]]
+    return [decode_embedding(item["embedding"]) for item in data["data"]]
+
+
+# One response embedding → float32 array: base64 little-endian float32, or a JSON float
+# list (encoding_format=float, or a server without base64 support). Nulls → None.
+def decode_embedding(value: str | list | None) -> np.ndarray | None:
+    if value is None:
+        return None
+    if isinstance(value, str):
+        return np.frombuffer(base64.b64decode(value), dtype="<f4")
+    if any(v is None for v in value):
+        return None
+    return np.asarray(value, dtype=np.float32)
@@ -0,0 +1,121 @@
+# INFRASTRUCTURE
+import hashlib
+import io
+import logging
+import os
+import struct
+
+import numpy as np
+
+from .embedder import embed_packed, embedding_identity
+
+# Consult embedding_cache before calling the embedding server (0 = always embed)
+EMBEDDING_CACHE = os.getenv("EMBEDDING_CACHE", "1") == "1"
+
+
+# ORCHESTRATOR
+
+# Drop-in for embed_workflow(texts, prefix) on the indexing path: texts embedded before
+# (same embedding_identity + prefix + content hash — any collection, any earlier run) come from
+# embedding_cache; only misses reach the GPU server (token-packed requests via
+# embed_packed) and are written back.
+def embed_cached(conn, texts: list[str], prefix: str) -> list[np.ndarray | None]:
+    if not EMBEDDING_CACHE:
+        return embed_packed(texts, prefix)
+    keys = [content_hash(t) for t in texts]
+    found = lookup_embeddings(conn, prefix, list(set(keys)))
+
+    missing: dict[bytes, str] = {}
+    for key, text in zip(keys, texts):
+        if key not in found:
+            missing.setdefault(key, text)
+    if missing:
+        embedded = embed_packed(list(missing.values()), prefix)
+        fresh = dict(zip(missing, embedded))
+        store_embeddings(conn, prefix, fresh)
+        found.update(fresh)
+
+    logging.info(f"Embedding cache: {len(texts) - len(missing)}/{len(texts)} hits, {len(missing)} embedded")
+    return [found[key] for key in keys]
+
+
+# FUNCTIONS
+
+# Ensure the cache table exists (called from indexer.ensure_schema).
+# `model` holds embedding_identity() (served model + context), not the EMBEDDING_MODEL name.
+# Unbounded dimension: the model column already separates vector sizes, and rows keep
+# the server's float4 output whatever EMBEDDING_STORAGE the chunk table uses.
+def ensure_embedding_cache(cur) -> None:
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS embedding_cache (
+            model TEXT NOT NULL,
+            prefix TEXT NOT NULL,
+            content_sha256 BYTEA NOT NULL,
+            embedding vector NOT NULL,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+            PRIMARY KEY (model, prefix, content_sha256)
+        )
+    """)
+
+
+# SHA-256 of the chunk text (before embed_workflow's truncation — same text, same key)
+def content_hash(text: str) -> bytes:
+    return hashlib.sha256(text.encode()).digest()
+
+
+# Cached embeddings for the given content hashes under the current embedding identity
+def lookup_embeddings(conn, prefix: str, keys: list[bytes]) -> dict[bytes, np.ndarray]:
+    if not keys:
+        return {}
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            SELECT content_sha256, embedding FROM embedding_cache
+            WHERE model = %s AND prefix = %s AND content_sha256 = ANY(%s)
+            """,
+            (embedding_identity(), prefix, keys),
+        )
+        rows = cur.fetchall()
+    return {bytes(key): to_array(value) for key, value in rows}
+
+
+# Write fresh embeddings back (own commit — survives a later failed chunk insert): one binary
+# COPY into a session temp table, then one INSERT … ON CONFLICT DO NOTHING (COPY cannot skip
+# duplicates). NULL vectors from the server are not cached, so they are retried next time.
+def store_embeddings(conn, prefix: str, embeddings: dict[bytes, np.ndarray | None]) -> None:
+    rows = [(key, embedding) for key, embedding in embeddings.items() if embedding is not None]
+    if not rows:
+        return
+    with conn.cursor() as cur:
+        cur.execute("CREATE TEMP TABLE IF NOT EXISTS embedding_staging (content_sha256 BYTEA, embedding vector)")
+        cur.execute("TRUNCATE embedding_staging")
+        cur.copy_expert("COPY embedding_staging FROM STDIN (FORMAT binary)", io.BytesIO(encode_cache_rows(rows)))
+        cur.execute(
+            """
+            INSERT INTO embedding_cache (model, prefix, content_sha256, embedding)
+            SELECT %s, %s, content_sha256, embedding FROM embedding_staging
+            ON CONFLICT DO NOTHING
+            """,
+            (embedding_identity(), prefix),
+        )
+    conn.commit()
+
+
+# PGCOPY binary stream of (content hash, embedding) rows for store_embeddings
+def encode_cache_rows(rows: list[tuple[bytes, np.ndarray]]) -> bytes:
+    # indexer imports this module — its vector encoder is imported late
+    from .indexer import encode_vector
+
+    parts = [b"PGCOPY\n\xff\r\n\x00", struct.pack(">ii", 0, 0)]
+    for key, embedding in rows:
+        vector = encode_vector(embedding)
+        parts += [struct.pack(">hi", 2, len(key)), key, struct.pack(">i", len(vector)), vector]
+    parts.append(struct.pack(">h", -1))
+    return b"".join(parts)
+
+
+# pgvector adapter value → float32 array, the shape embed_workflow returns
+def to_array(value) -> np.ndarray:
+    if hasattr(value, "to_numpy"):
+        return value.to_numpy().astype(np.float32, copy=False)
+    return np.asarray(value, dtype=np.float32)
@@ -0,0 +1,48 @@
+# INFRASTRUCTURE
+import threading
+from urllib.parse import urlsplit
+
+import httpx
+
+# Idle keep-alive connections per GPU server; one client per service is enough because
+# indexing and search send one request at a time per service (threads share the client).
+KEEPALIVE_CONNECTIONS = 4
+KEEPALIVE_EXPIRY = 30.0
+
+_clients: dict[str, tuple[str, httpx.Client]] = {}
+_lock = threading.Lock()
+
+
+# FUNCTIONS
+
+# POST JSON to a GPU server over the service's pooled keep-alive client
+def post_json(service: str, url: str, payload: dict, timeout: float) -> httpx.Response:
+    return get_client(service, url).post(url, json=payload, timeout=timeout)
+
+
+# Shared httpx.Client for a service (embedding / reranker / splade), created on first use.
+# Rebuilt when the server's base URL changes (port reallocated after a restart) —
+# the old client and its idle connections are closed.
+def get_client(service: str, url: str) -> httpx.Client:
+    parts = urlsplit(url)
+    base = f"{parts.scheme}://{parts.netloc}"
+    with _lock:
+        entry = _clients.get(service)
+        if entry and entry[0] == base:
+            return entry[1]
+        if entry:
+            entry[1].close()
+        client = httpx.Client(limits=httpx.Limits(
+            max_keepalive_connections=KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=KEEPALIVE_EXPIRY,
+        ))
+        _clients[service] = (base, client)
+        return client
+
+
+# Close every client (tests, process shutdown)
+def close_clients() -> None:
+    with _lock:
+        for _, client in _clients.values():
+            client.close()
+        _clients.clear()
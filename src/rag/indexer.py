@@ -1,13 +1,30 @@
 # INFRASTRUCTURE
+import hashlib
+import io
 import json
 import logging
 import os
+import struct
 from pathlib import Path
 
+import numpy as np
 from dotenv import load_dotenv
-
+from psycopg2 import sql
+from psycopg2.extras import execute_values
+
+from .catalog import (
+    bump_generation,
+    ensure_catalog,
+    forget_collection,
+    forget_document,
+    rebuild_catalog,
+    record_chunks,
+    resolve_collection,
+    resolve_document,
+)
 from .db import get_connection
-from .embedder import embed_workflow
+from .embedder import EMBEDDING_MODEL
+from .embedding_cache import ensure_embedding_cache
 from .sparse_embedder import sparse_embed_workflow
 
 load_dotenv()
@@ -22,46 +39,44 @@ logging.basicConfig(
 )
 
 VECTOR_DIMENSION = int(os.getenv("VECTOR_DIMENSION", "4096"))
+# Matryoshka-truncated halfvec copy of `embedding` that carries the HNSW index.
+# pgvector caps HNSW at 4000 dims for halfvec; see decisions/retrieval02_search.md.
+MRL_DIMENSION = int(os.getenv("MRL_DIMENSION", "1024"))
+HNSW_M = 16
+HNSW_EF_CONSTRUCTION = 64
+# Opt-in sign-quantized bit(VECTOR_DIMENSION) copy of `embedding` for the Hamming prefilter (DENSE_SEARCH_MODE=binary)
+BINARY_QUANTIZATION = os.getenv("BINARY_QUANTIZATION", "0") == "1"
+# Column type of chunk_vectors.embedding: "vector" (float4) or "halfvec" (float16 — half the
+# table/TOAST size and sequential-scan I/O). Existing tables switch via `workflow.py convert-embeddings`.
+EMBEDDING_STORAGE = os.getenv("EMBEDDING_STORAGE", "vector")
 BATCH_SIZE = 32
+# Chunks of one document per embed_cached call when indexing. Cache misses in the window are
+# packed into EMBED_BATCH_TOKENS requests; the window is stored in original chunk order.
+EMBED_WINDOW = int(os.getenv("EMBED_WINDOW", "128"))
+# Rows per committed batch of the online embedding conversion and derived-column backfill
+CONVERT_BATCH = 1000
+
+# Collection name → collection_id (per process). Catalog ids are never removed or reused,
+# so this is safe to keep; partitions are not cached (ensure_partition re-checks them).
+_collection_ids: dict[str, int] = {}
 
 
 # ORCHESTRATOR
 
 
-# Index from chunks.json (pre-chunked, LLM-cleaned)
+# Index from chunks.json (pre-chunked, LLM-cleaned). Batches run through pipeline.py:
+# the next batch is embedded while the previous one is written.
 def index_json_workflow(json_path: str) -> int:
+    from .pipeline import index_pipeline
+
     conn_ddl = get_connection(purpose="ddl")
     ensure_schema(conn_ddl)
     conn_ddl.close()
-    conn = get_connection(purpose="write")
 
     chunks = load_chunks_json(json_path)
     if not chunks:
-        conn.close()
         return 0
-
-    collection = chunks[0]["collection"]
-    documents = {c["document"] for c in chunks}
-    for doc in sorted(documents):
-        deleted = delete_chunks(conn, collection, doc)
-        if deleted > 0:
-            print(f"Deleted {deleted} existing chunks for {collection}/{doc}")
-
-    total = len(chunks)
-    skipped_total = 0
-    for i in range(0, total, BATCH_SIZE):
-        batch = chunks[i:i + BATCH_SIZE]
-        texts = [c["content"] for c in batch]
-        embeddings = embed_workflow(texts, "search_document: ")
-        skipped = store_chunks(conn, batch, embeddings)
-        skipped_total += skipped
-        suffix = f" ({skipped} NULL skipped)" if skipped else ""
-        print(f"Indexed {min(i + BATCH_SIZE, total)}/{total} chunks{suffix}")
-
-    conn.close()
-    indexed = total - skipped_total
-    logging.info(f"Indexed {indexed}/{total} chunks from {json_path} ({skipped_total} skipped)")
-    return indexed
+    return index_pipeline([(json_path, chunks)])[json_path]
 
 
 # Delete chunks by collection and/or document; optionally remove source MDs from data/documents/
@@ -93,35 +108,104 @@ def delete_workflow(
     return {"chunks_deleted": deleted, "files_removed": files_removed}
 
 
-# Backfill sparse embeddings for chunks that have NULL sparse_embedding
+# Backfill sparse embeddings for chunks that have NULL sparse_embedding, then make sure the
+# sparsevec HNSW index exists (built here, opt-in, never by ensure_schema)
 def backfill_splade_workflow(collection: str) -> int:
     conn_ddl = get_connection(purpose="ddl")
     ensure_schema(conn_ddl)
     conn_ddl.close()
     conn = get_connection(purpose="write")
 
-    rows = fetch_null_sparse(conn, collection)
-    if not rows:
+    total = count_null_sparse(conn, collection)
+    if not total:
         print(f"No chunks with NULL sparse_embedding in {collection}")
         conn.close()
+        build_sparse_index()
         return 0
 
-    total = len(rows)
+    # Keyset pages of BATCH_SIZE rows: only one batch of chunk text is held at a time
     updated = 0
-    for i in range(0, total, BATCH_SIZE):
-        batch = rows[i:i + BATCH_SIZE]
+    last_id = 0
+    while batch := fetch_null_sparse(conn, collection, last_id, BATCH_SIZE):
         ids = [r[0] for r in batch]
         texts = [r[1] for r in batch]
         sparse_embeddings = sparse_embed_workflow(texts)
-        update_sparse(conn, ids, sparse_embeddings)
+        update_sparse(conn, collection, ids, sparse_embeddings)
+        last_id = ids[-1]
         updated += len(batch)
         print(f"Backfilled {min(updated, total)}/{total} chunks")
 
     conn.close()
     logging.info(f"Backfilled {total} sparse embeddings for {collection}")
+    build_sparse_index()
     return total
 
 
+# Derive embedding_mrl (and embedding_bin with BINARY_QUANTIZATION=1) for rows that lack it,
+# then build the MRL HNSW index partition by partition. The explicit, online form of what
+# DENSE_SEARCH_MODE=ann / binary need: batched backfill, CREATE INDEX CONCURRENTLY, no
+# statement timeout; rerunning resumes. Returns rows backfilled.
+def build_ann_index_workflow() -> int:
+    conn = maintenance_connection()
+    try:
+        ensure_schema(conn)
+        filled = ensure_derived_column(conn, "embedding_mrl", MRL_DIMENSION)
+        if BINARY_QUANTIZATION:
+            filled += ensure_derived_column(conn, "embedding_bin", VECTOR_DIMENSION)
+        build_partitioned_index(
+            conn, "idx_chunk_vectors_embedding_mrl",
+            f"hnsw (embedding_mrl halfvec_cosine_ops) WITH (m = {HNSW_M}, ef_construction = {HNSW_EF_CONSTRUCTION})",
+        )
+    finally:
+        conn.close()
+    logging.info(f"Built ANN index; backfilled {filled} derived vectors")
+    return filled
+
+
+# Recompute the collection catalog from the documents table (repair after manual SQL edits)
+def rebuild_catalog_workflow() -> int:
+    conn = get_connection(purpose="ddl")
+    ensure_schema(conn)
+    with conn.cursor() as cur:
+        documents = rebuild_catalog(cur)
+    conn.commit()
+    conn.close()
+    logging.info(f"Rebuilt collection catalog: {documents} documents")
+    return documents
+
+
+# Convert chunk_vectors.embedding to EMBEDDING_STORAGE online; derived columns and the MRL
+# index are kept
+def convert_embeddings_workflow() -> int:
+    conn = maintenance_connection()
+    try:
+        ensure_schema(conn)
+        converted = convert_embedding_storage(conn)
+    finally:
+        conn.close()
+    logging.info(f"Converted {converted} embeddings to {EMBEDDING_STORAGE}")
+    return converted
+
+
+# Move a name-keyed `documents` table (older schemas) into the dictionary-encoded partitioned
+# tables — explicit, never run by ensure_schema. Online like build-ann-index: one short
+# catalog-only transaction renames the old tables aside and creates the new ones, then rows are
+# copied in committed keyset batches (derived columns computed per batch) while indexing and
+# search run on the new tables; legacy chunks become searchable as their batches land.
+# Rerunning resumes. Returns chunks copied.
+def migrate_legacy_workflow() -> int:
+    conn = maintenance_connection()
+    try:
+        ensure_schema(conn, detach_legacy=True)
+        with conn.cursor() as cur:
+            legacy = legacy_tables(cur)
+        copied = copy_legacy_documents(conn, legacy) if legacy else 0
+    finally:
+        conn.close()
+    logging.info(f"Migrated {copied} legacy chunks")
+    return copied
+
+
 # FUNCTIONS
 
 # Load chunks from JSON file
@@ -150,69 +234,515 @@ def load_chunks_json(json_path: str) -> list[dict]:
     ]
 
 
-# Ensure pgvector extension and table exist
-def ensure_schema(conn) -> None:
+# Ensure pgvector extension and the LIST-partitioned documents / chunk_vectors tables exist.
+# Chunk rows carry collection_id / document_id integers from the catalog dictionary
+# (catalog.py); one partition pair per collection_id, created on first insert by
+# ensure_partition. Runs as a single transaction even on autocommit connections.
+# Runs before every index/sync, so it only does cheap catalog DDL: derived vector columns of
+# existing tables and the HNSW indexes are built by build_ann_index_workflow, and an older
+# name-keyed schema is only detected — migrate_legacy_workflow (the one caller passing
+# detach_legacy) renames it aside in this transaction and copies its rows afterwards.
+def ensure_schema(conn, detach_legacy: bool = False) -> None:
+    if EMBEDDING_STORAGE not in ("vector", "halfvec"):
+        raise ValueError(f"Unknown EMBEDDING_STORAGE '{EMBEDDING_STORAGE}'. Valid: vector, halfvec")
+    autocommit = conn.autocommit
+    if autocommit:
+        conn.autocommit = False
+    try:
+        with conn.cursor() as cur:
+            cur.execute("CREATE EXTENSION IF NOT EXISTS vector")
+            catalog_created = ensure_catalog(cur)
+            ensure_embedding_cache(cur)
+            detached = detach_legacy_documents(cur) if detach_legacy else False
+            if not detach_legacy and legacy_layout(cur):
+                raise RuntimeError("documents is still keyed by collection/document names — run `workflow.py migrate-legacy` first")
+            cur.execute("CREATE SEQUENCE IF NOT EXISTS documents_id_seq")
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS documents (
+                    id INTEGER NOT NULL DEFAULT nextval('documents_id_seq'),
+                    collection_id INTEGER NOT NULL,
+                    document_id INTEGER NOT NULL,
+                    content TEXT NOT NULL,
+                    chunk_index INTEGER NOT NULL,
+                    total_chunks INTEGER NOT NULL,
+                    PRIMARY KEY (id, collection_id)
+                ) PARTITION BY LIST (collection_id)
+            """)
+            cur.execute("ALTER SEQUENCE documents_id_seq OWNED BY documents.id")
+            cur.execute("""
+                DO $$ BEGIN
+                    ALTER TABLE documents ADD COLUMN tsv tsvector
+                        GENERATED ALWAYS AS (to_tsvector('english', content)) STORED;
+                EXCEPTION WHEN duplicate_column THEN NULL;
+                END $$
+            """)
+            # Embeddings live in a side table keyed like documents, so text queries never
+            # touch vector pages. No FK: a partitioned FK would block dropping documents
+            # partitions; indexer.py deletes both sides itself.
+            # embedding_mrl / embedding_bin are derived from embedding by copy_chunks
+            binary = f"embedding_bin bit({VECTOR_DIMENSION})," if BINARY_QUANTIZATION else ""
+            cur.execute(f"""
+                CREATE TABLE IF NOT EXISTS chunk_vectors (
+                    id INTEGER NOT NULL,
+                    collection_id INTEGER NOT NULL,
+                    document_id INTEGER NOT NULL,
+                    embedding {EMBEDDING_STORAGE}({VECTOR_DIMENSION}),
+                    sparse_embedding sparsevec(30522),
+                    embedding_mrl halfvec({MRL_DIMENSION}),
+                    {binary}
+                    PRIMARY KEY (id, collection_id)
+                ) PARTITION BY LIST (collection_id)
+            """)
+            storage = embedding_storage(cur)
+            if storage != EMBEDDING_STORAGE:
+                logging.warning(f"chunk_vectors.embedding is {storage}, EMBEDDING_STORAGE={EMBEDDING_STORAGE} — run `workflow.py convert-embeddings`")
+            derived = derived_columns(cur)
+            if derived.get("embedding_mrl", (None,))[0] != MRL_DIMENSION or (BINARY_QUANTIZATION and "embedding_bin" not in derived):
+                logging.warning(f"chunk_vectors derived columns {derived} do not match MRL_DIMENSION={MRL_DIMENSION} / BINARY_QUANTIZATION — run `workflow.py build-ann-index`")
+            if not detach_legacy and legacy_tables(cur):
+                logging.warning("documents_legacy still holds chunks not yet copied — run `workflow.py migrate-legacy`")
+            if catalog_created or detached:
+                documents = rebuild_catalog(cur)
+                logging.info(f"Bootstrapped collection catalog: {documents} documents")
+            cur.execute("CREATE INDEX IF NOT EXISTS idx_documents_tsv ON documents USING gin(tsv)")
+            cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_documents_unique ON documents(collection_id, document_id, chunk_index)")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        if autocommit:
+            conn.autocommit = True
+    logging.info("Schema ensured")
+
+
+# Columns of `documents` if it is still keyed by collection/document names (plain heap or
+# partitioned by name, with or without embedding columns), else None
+def legacy_layout(cur) -> set[str] | None:
+    cur.execute("""
+        SELECT attname FROM pg_attribute
+        WHERE attrelid = to_regclass('documents') AND attnum > 0 AND NOT attisdropped
+    """)
+    columns = {row[0] for row in cur.fetchall()}
+    return columns if "collection" in columns else None
+
+
+# Rename a name-keyed `documents` (and chunk_vectors) out of the way and free their
+# partition/constraint/index/sequence names for the new tables. Renames and index drops
+# only — no rows are read. Returns True if there was anything to detach.
+def detach_legacy_documents(cur) -> bool:
+    columns = legacy_layout(cur)
+    if columns is None:
+        return False
+    logging.info("Detaching name-keyed documents for migration to dictionary-encoded partitioned tables")
+    if "embedding" in columns:
+        cur.execute("ALTER TABLE documents ADD COLUMN IF NOT EXISTS sparse_embedding sparsevec(30522)")
+    for index in ("idx_documents_tsv", "idx_documents_unique", "idx_documents_embedding_mrl",
+                  "idx_documents_sparse", "idx_chunk_vectors_embedding_mrl", "idx_chunk_vectors_sparse"):
+        cur.execute(f"DROP INDEX IF EXISTS {index}")
+
+    cur.execute("SELECT to_regclass('chunk_vectors')")
+    tables = ["documents", "chunk_vectors"] if cur.fetchone()[0] is not None else ["documents"]
+    for table in tables:
+        cur.execute(
+            "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid WHERE i.inhparent = %s::regclass",
+            (table,),
+        )
+        for (partition,) in cur.fetchall():
+            cur.execute(sql.SQL("ALTER TABLE {} RENAME TO {}").format(
+                sql.Identifier(partition), sql.Identifier(f"{partition}_legacy")))
+        cur.execute(sql.SQL("ALTER TABLE {} RENAME TO {}").format(
+            sql.Identifier(table), sql.Identifier(f"{table}_legacy")))
+        cur.execute(sql.SQL("ALTER TABLE {} RENAME CONSTRAINT {} TO {}").format(
+            sql.Identifier(f"{table}_legacy"), sql.Identifier(f"{table}_pkey"), sql.Identifier(f"{table}_legacy_pkey")))
+    cur.execute("ALTER SEQUENCE documents_id_seq OWNED BY NONE")
+    return True
+
+
+# Detached legacy tables still to copy: {"documents": table, "vectors": table holding the
+# embeddings}, or None
+def legacy_tables(cur) -> dict | None:
+    cur.execute("SELECT to_regclass('documents_legacy'), to_regclass('chunk_vectors_legacy')")
+    documents, vectors = cur.fetchone()
+    if documents is None:
+        return None
+    return {"documents": "documents_legacy", "vectors": "chunk_vectors_legacy" if vectors else "documents_legacy"}
+
+
+# Copy detached legacy rows into the dictionary-encoded tables in committed keyset batches of
+# CONVERT_BATCH, then drop them. Names go to the catalog first; ids are preserved (same
+# sequence, so rows indexed meanwhile get larger ids); counts and generation are updated per
+# batch like store_chunks does. A document re-indexed since the detach keeps its new chunks
+# (its legacy rows are skipped); rows copied by an interrupted run conflict and are skipped.
+# Needs an autocommit connection without statement timeout. Returns chunks copied.
+def copy_legacy_documents(conn, legacy: dict) -> int:
     with conn.cursor() as cur:
-        cur.execute("CREATE EXTENSION IF NOT EXISTS vector")
+        cur.execute(f"SELECT DISTINCT collection FROM {legacy['documents']}")
+        for (collection,) in cur.fetchall():
+            create_partition(cur, collection, resolve_collection(cur, collection))
         cur.execute(f"""
-            CREATE TABLE IF NOT EXISTS documents (
-                id SERIAL PRIMARY KEY,
-                content TEXT NOT NULL,
-                collection TEXT NOT NULL,
-                document TEXT NOT NULL,
-                chunk_index INTEGER NOT NULL,
-                total_chunks INTEGER NOT NULL,
-                embedding vector({VECTOR_DIMENSION})
-            )
+            INSERT INTO collection_documents (collection_id, document)
+            SELECT DISTINCT c.collection_id, l.document
+            FROM {legacy['documents']} l
+            JOIN collections c ON c.collection = l.collection
+            ON CONFLICT (collection_id, document) DO NOTHING
         """)
-        cur.execute("ALTER TABLE documents ADD COLUMN IF NOT EXISTS sparse_embedding sparsevec(30522)")
-        cur.execute("""
-            DO $$ BEGIN
-                ALTER TABLE documents ADD COLUMN tsv tsvector
-                    GENERATED ALWAYS AS (to_tsvector('english', content)) STORED;
-            EXCEPTION WHEN duplicate_column THEN NULL;
-            END $$
-        """)
-        cur.execute("CREATE INDEX IF NOT EXISTS idx_documents_tsv ON documents USING gin(tsv)")
-        cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_documents_unique ON documents(collection, document, chunk_index)")
+        cur.execute(f"SELECT COALESCE(MAX(id), 0) FROM {legacy['documents']}")
+        legacy_max = cur.fetchone()[0]
+        # Resume after the last legacy id already copied
+        cur.execute("SELECT COALESCE(MAX(id), 0) FROM documents WHERE id <= %s", (legacy_max,))
+        last_id = cur.fetchone()[0]
+        columns, values = derived_insert(cur, "v.embedding")
+
+    copied = 0
+    while True:
+        with conn.cursor() as cur:
+            cur.execute(
+                f"""
+                WITH batch AS (
+                    SELECT id, collection, document, content, chunk_index, total_chunks
+                    FROM {legacy['documents']}
+                    WHERE id > %(last_id)s
+                    ORDER BY id
+                    LIMIT %(limit)s
+                ), moved AS (
+                    INSERT INTO documents (id, collection_id, document_id, content, chunk_index, total_chunks)
+                    SELECT b.id, cd.collection_id, cd.document_id, b.content, b.chunk_index, b.total_chunks
+                    FROM batch b
+                    JOIN collections c ON c.collection = b.collection
+                    JOIN collection_documents cd ON cd.collection_id = c.collection_id AND cd.document = b.document
+                    WHERE NOT EXISTS (
+                        SELECT 1 FROM documents d
+                        WHERE d.collection_id = cd.collection_id AND d.document_id = cd.document_id AND d.id > %(legacy_max)s
+                    )
+                    ON CONFLICT DO NOTHING
+                    RETURNING id, collection_id, document_id, total_chunks
+                ), vectors AS (
+                    INSERT INTO chunk_vectors (id, collection_id, document_id, embedding, sparse_embedding{columns})
+                    SELECT m.id, m.collection_id, m.document_id, v.embedding, v.sparse_embedding{values}
+                    FROM moved m
+                    JOIN {legacy['vectors']} v ON v.id = m.id
+                ), counts AS (
+                    SELECT collection_id, document_id, COUNT(*) AS added, MAX(total_chunks) AS total_chunks
+                    FROM moved GROUP BY collection_id, document_id
+                ), documents_counted AS (
+                    UPDATE collection_documents cd
+                    SET chunk_count = cd.chunk_count + n.added,
+                        total_chunks = GREATEST(cd.total_chunks, n.total_chunks),
+                        updated_at = NOW()
+                    FROM counts n WHERE cd.document_id = n.document_id
+                ), collections_counted AS (
+                    UPDATE collections c
+                    SET chunk_count = c.chunk_count + n.added, generation = c.generation + 1, updated_at = NOW()
+                    FROM (SELECT collection_id, SUM(added) AS added FROM counts GROUP BY collection_id) n
+                    WHERE c.collection_id = n.collection_id
+                )
+                SELECT (SELECT MAX(id) FROM batch), (SELECT COUNT(*) FROM moved)
+                """,
+                {"last_id": last_id, "limit": CONVERT_BATCH, "legacy_max": legacy_max},
+            )
+            batch_max, moved = cur.fetchone()
+        conn.commit()
+        if batch_max is None:
+            break
+        copied += moved
+        last_id = batch_max
+        logging.info(f"Copied {copied} legacy chunks (id <= {last_id})")
+
+    with conn.cursor() as cur:
+        for table in {legacy["vectors"], legacy["documents"]}:
+            cur.execute(f"DROP TABLE {table}")
     conn.commit()
-    logging.info("Schema ensured")
+    logging.info(f"Migrated {copied} chunks into dictionary-encoded documents + chunk_vectors tables")
+    return copied
 
 
-# Delete all chunks for a collection
-def delete_collection(conn, collection: str) -> int:
+# Autocommit DDL connection without statement timeout (restored on the next checkout),
+# for batched backfills and CREATE INDEX CONCURRENTLY
+def maintenance_connection():
+    conn = get_connection(purpose="ddl", autocommit=True)
+    with conn.cursor() as cur:
+        cur.execute("SET statement_timeout = 0")
+    return conn
+
+
+# Build the sparsevec HNSW index per partition (CONCURRENTLY) if missing. sparsevec HNSW
+# indexes up to 1000 non-zeros; splade_server caps at MAX_ACTIVE_DIMS=256. NULL
+# sparse_embedding rows (chunks not yet backfilled) are simply not in the graph.
+def build_sparse_index() -> None:
+    conn = maintenance_connection()
+    try:
+        build_partitioned_index(
+            conn, "idx_chunk_vectors_sparse",
+            f"hnsw (sparse_embedding sparsevec_ip_ops) WITH (m = {HNSW_M}, ef_construction = {HNSW_EF_CONSTRUCTION})",
+        )
+    finally:
+        conn.close()
+
+
+# Derived vector columns of chunk_vectors: name → (dimension, generated) for embedding_mrl /
+# embedding_bin. Generated columns (older schemas) are computed by Postgres; plain ones are
+# written by copy_chunks and backfilled by build_ann_index_workflow.
+def derived_columns(cur) -> dict[str, tuple[int, bool]]:
+    cur.execute("""
+        SELECT attname, atttypmod, attgenerated = 's' FROM pg_attribute
+        WHERE attrelid = 'chunk_vectors'::regclass AND attname IN ('embedding_mrl', 'embedding_bin') AND NOT attisdropped
+    """)
+    return {name: (dimension, generated) for name, dimension, generated in cur.fetchall()}
+
+
+# ", col, ..." / ", expr, ..." to append to an INSERT into chunk_vectors so it fills the plain
+# derived columns from the full embedding expression `source` (generated ones fill themselves)
+def derived_insert(cur, source: str) -> tuple[str, str]:
+    derived = [(column, dimension) for column, (dimension, generated) in derived_columns(cur).items() if not generated]
+    columns = "".join(f", {column}" for column, _ in derived)
+    values = "".join(f", {derived_expression(column, dimension, source)}" for column, dimension in derived)
+    return columns, values
+
+
+# Column type of a derived column: MRL-truncated halfvec, or sign-quantized bits (1 per dim,
+# 32x smaller than float4)
+def derived_type(column: str, dimension: int) -> str:
+    return f"halfvec({dimension})" if column == "embedding_mrl" else f"bit({dimension})"
+
+
+# SQL computing a derived column from the full embedding expression `source`
+def derived_expression(column: str, dimension: int, source: str = "embedding") -> str:
+    if column == "embedding_mrl":
+        return f"subvector({source}, 1, {dimension})::halfvec({dimension})"
+    return f"binary_quantize({source})::bit({dimension})"
+
+
+# Make `column` a derived column of the given dimension and fill it for rows that lack it.
+# Adding or replacing a nullable column is a catalog-only change (brief lock, no rewrite);
+# the values are written in committed keyset batches while reads and writes go on.
+# A generated column of the right dimension is already complete. Returns rows filled.
+def ensure_derived_column(conn, column: str, dimension: int) -> int:
+    with conn.cursor() as cur:
+        existing = derived_columns(cur).get(column)
+        if existing is not None and existing[0] == dimension and existing[1]:
+            return 0
+        if existing is not None and existing[0] != dimension:
+            logging.info(f"{column} dimension {existing[0]} != {dimension} — replacing column")
+            cur.execute(f"ALTER TABLE chunk_vectors DROP COLUMN {column}")
+            existing = None
+        if existing is None:
+            cur.execute(f"ALTER TABLE chunk_vectors ADD COLUMN {column} {derived_type(column, dimension)}")
+    conn.commit()
+    return backfill_column(conn, column, derived_expression(column, dimension, "v.embedding"))
+
+
+# Set column = expression (over `v`, the updated row) where it is NULL, in committed keyset
+# batches of CONVERT_BATCH rows (rerunning resumes). Returns rows written.
+def backfill_column(conn, column: str, expression: str) -> int:
+    filled, last_id = 0, 0
+    while True:
+        with conn.cursor() as cur:
+            cur.execute(
+                f"""
+                UPDATE chunk_vectors v SET {column} = {expression}
+                FROM (
+                    SELECT id, collection_id FROM chunk_vectors
+                    WHERE id > %s AND {column} IS NULL AND embedding IS NOT NULL
+                    ORDER BY id
+                    LIMIT %s
+                ) batch
+                WHERE v.id = batch.id AND v.collection_id = batch.collection_id
+                RETURNING v.id
+                """,
+                (last_id, CONVERT_BATCH),
+            )
+            ids = [row[0] for row in cur.fetchall()]
+        conn.commit()
+        if not ids:
+            return filled
+        filled += len(ids)
+        last_id = max(ids)
+        logging.info(f"Backfilled {column} for {filled} rows (id <= {last_id})")
+
+
+# Build index `name` on chunk_vectors without blocking writes: CREATE INDEX CONCURRENTLY on
+# each partition, attached to a parent index created ON ONLY chunk_vectors — valid once every
+# partition is attached, and inherited by partitions created later. Needs an autocommit
+# connection without statement timeout; rerunning skips attached partitions and rebuilds an
+# invalid leftover of an interrupted build.
+def build_partitioned_index(conn, name: str, definition: str) -> None:
+    with conn.cursor() as cur:
+        cur.execute(f"CREATE INDEX IF NOT EXISTS {name} ON ONLY chunk_vectors USING {definition}")
+        cur.execute(
+            """
+            SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = 'chunk_vectors'::regclass
+              AND c.oid NOT IN (
+                  SELECT x.indrelid FROM pg_inherits h JOIN pg_index x ON x.indexrelid = h.inhrelid
+                  WHERE h.inhparent = %s::regclass
+              )
+            ORDER BY c.relname
+            """,
+            (name,),
+        )
+        for (partition,) in cur.fetchall():
+            child = f"{name}_{partition.rsplit('_', 1)[1]}"
+            cur.execute("SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass(%s)", (child,))
+            row = cur.fetchone()
+            if row is not None and not row[0]:
+                cur.execute(f"DROP INDEX CONCURRENTLY {child}")
+            if row is None or not row[0]:
+                logging.info(f"Building {child} on {partition}")
+                cur.execute(f"CREATE INDEX CONCURRENTLY {child} ON {partition} USING {definition}")
+            cur.execute(f"ALTER INDEX {name} ATTACH PARTITION {child}")
+
+
+# Current type name of chunk_vectors.embedding ("vector" or "halfvec")
+def embedding_storage(cur) -> str:
+    cur.execute("""
+        SELECT t.typname FROM pg_attribute a JOIN pg_type t ON t.oid = a.atttypid
+        WHERE a.attrelid = 'chunk_vectors'::regclass AND a.attname = 'embedding' AND NOT a.attisdropped
+    """)
+    return cur.fetchone()[0]
+
+
+# Switch chunk_vectors.embedding to EMBEDDING_STORAGE without holding a lock for the copy.
+# Online (reads and writes go on, rerunning resumes): generated embedding_mrl / embedding_bin
+# become plain columns (DROP EXPRESSION — catalog only; values and the MRL index stay, and
+# they do not depend on the storage type), rows are cast into a shadow column in committed
+# keyset batches, then a partial index on the rows still unconverted is built CONCURRENTLY.
+# The swap holds SHARE (writes wait, searches go on) while that index finds rows inserted
+# meanwhile, and ACCESS EXCLUSIVE only to drop and rename — no table rewrite under either.
+# The dropped column's space comes back only with a later rewrite (VACUUM FULL / pg_repack).
+# Needs an autocommit connection (maintenance_connection). Returns rows converted.
+def convert_embedding_storage(conn) -> int:
+    with conn.cursor() as cur:
+        if embedding_storage(cur) == EMBEDDING_STORAGE:
+            return 0
+        for column, (_, generated) in derived_columns(cur).items():
+            if generated:
+                cur.execute(f"ALTER TABLE chunk_vectors ALTER COLUMN {column} DROP EXPRESSION")
+        cur.execute(f"ALTER TABLE chunk_vectors ADD COLUMN IF NOT EXISTS embedding_new {EMBEDDING_STORAGE}({VECTOR_DIMENSION})")
+
+    converted = backfill_column(conn, "embedding_new", "v.embedding")
+    build_partitioned_index(conn, "idx_chunk_vectors_unconverted", "btree (id) WHERE embedding_new IS NULL AND embedding IS NOT NULL")
+
+    conn.autocommit = False
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SET LOCAL statement_timeout = 0")
+            cur.execute("LOCK TABLE chunk_vectors IN SHARE MODE")
+            # Stragglers only: the partial index holds just the rows the batches missed
+            cur.execute("SET LOCAL enable_seqscan = off")
+            cur.execute("UPDATE chunk_vectors SET embedding_new = embedding WHERE embedding_new IS NULL AND embedding IS NOT NULL")
+            converted += cur.rowcount
+            cur.execute("LOCK TABLE chunk_vectors IN ACCESS EXCLUSIVE MODE")
+            # Takes idx_chunk_vectors_unconverted with it
+            cur.execute("ALTER TABLE chunk_vectors DROP COLUMN embedding CASCADE")
+            cur.execute("ALTER TABLE chunk_vectors RENAME COLUMN embedding_new TO embedding")
+            # Stored values changed precision: the bump makes segments refresh, and their meta
+            # records the storage type, so they rebuild (and IVF-PQ re-encodes) rather than append
+            cur.execute("SELECT collection FROM collections WHERE chunk_count > 0")
+            for (collection,) in cur.fetchall():
+                bump_generation(cur, collection)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.autocommit = True
+    return converted
+
+
+# Partition table name for a collection. Collection names are free text, so the
+# name is derived from a hash rather than the raw string.
+def partition_name(collection: str, table: str = "documents") -> str:
+    return f"{table}_{hashlib.md5(collection.encode()).hexdigest()[:16]}"
+
+
+# Create the documents + chunk_vectors partitions for a collection if missing. Indexes
+# defined on the parents (tsv GIN, unique, HNSW) are created on new partitions automatically.
+def create_partition(cur, collection: str, collection_id: int) -> None:
+    for table in ("documents", "chunk_vectors"):
+        cur.execute(
+            sql.SQL("CREATE TABLE IF NOT EXISTS {} PARTITION OF {} FOR VALUES IN ({})").format(
+                sql.Identifier(partition_name(collection, table)), sql.Identifier(table), sql.Literal(collection_id)
+            )
+        )
+
+
+# Ensure a collection's catalog row + partitions exist before an insert; returns its collection_id.
+# Checked via lookups first so steady-state inserts never write the catalog or take the DDL lock on documents.
+# The partitions are looked up in pg_inherits on every call, not remembered: another process
+# (delete --collection → drop_partition) may have dropped them since, and the daemon is long-lived.
+def ensure_partition(conn, collection: str) -> int:
+    with conn.cursor() as cur:
+        collection_id = _collection_ids.get(collection)
+        if collection_id is None:
+            cur.execute("SELECT collection_id FROM collections WHERE collection = %s", (collection,))
+            row = cur.fetchone()
+            collection_id = row[0] if row else resolve_collection(cur, collection)
+        cur.execute(
+            "SELECT COUNT(*) FROM pg_inherits WHERE inhrelid IN (to_regclass(%s), to_regclass(%s))",
+            (partition_name(collection), partition_name(collection, "chunk_vectors")),
+        )
+        if cur.fetchone()[0] < 2:
+            create_partition(cur, collection, collection_id)
+            logging.info(f"Created partition {partition_name(collection)} for collection {collection}")
+    conn.commit()
+    _collection_ids[collection] = collection_id
+    return collection_id
+
+
+# Drop a collection's partition — O(1) regardless of chunk count, no vacuum debt.
+# Returns the number of chunks that were in it.
+def drop_partition(conn, collection: str) -> int:
+    name = partition_name(collection)
     with conn.cursor() as cur:
-        cur.execute("DELETE FROM documents WHERE collection = %s", (collection,))
-        deleted = cur.rowcount
+        cur.execute("SELECT to_regclass(%s)", (name,))
+        if cur.fetchone()[0] is None:
+            conn.commit()
+            return 0
+        cur.execute(sql.SQL("SELECT COUNT(*) FROM {}").format(sql.Identifier(name)))
+        deleted = cur.fetchone()[0]
+        cur.execute(sql.SQL("DROP TABLE IF EXISTS {}").format(sql.Identifier(partition_name(collection, "chunk_vectors"))))
+        cur.execute(sql.SQL("DROP TABLE {}").format(sql.Identifier(name)))
+        bump_generation(cur, collection)
+        forget_collection(cur, collection)
     conn.commit()
     return deleted
 
 
+# Delete all chunks for a collection
+def delete_collection(conn, collection: str) -> int:
+    return drop_partition(conn, collection)
+
+
 # Check if a document has a complete chunk set in the documents table.
-# Complete means COUNT(*) > 0 AND COUNT(*) == MAX(total_chunks) — every
-# expected chunk-row is present. Used by workflow.py index-dir / index-file
-# to detect documents that were indexed before indexed_files tracking
-# existed (adopt-on-complete pattern: register hash without re-embed).
+# Complete means chunk_count > 0 AND chunk_count == total_chunks in the
+# collection_documents catalog — every expected chunk-row is present. Used by
+# workflow.py index-dir / index-file to detect documents that were indexed
+# before indexed_files tracking existed (adopt-on-complete pattern: register
+# hash without re-embed).
 def doc_is_complete(conn, collection: str, document: str) -> bool:
     with conn.cursor() as cur:
         cur.execute(
             """
-            SELECT COUNT(*), MAX(total_chunks)
-            FROM documents
-            WHERE collection = %s AND document = %s
+            SELECT cd.chunk_count, cd.total_chunks
+            FROM collection_documents cd
+            JOIN collections c ON c.collection_id = cd.collection_id
+            WHERE c.collection = %s AND cd.document = %s
             """,
             (collection, document),
         )
-        actual, expected = cur.fetchone()
-    return actual is not None and actual > 0 and actual == expected
+        row = cur.fetchone()
+    return row is not None and row[0] > 0 and row[0] == row[1]
 
 
-# Delete chunks by collection and/or document
+# Delete chunks by collection and/or document. A whole-collection delete drops its partition.
 def delete_chunks(conn, collection: str | None, document: str | None) -> int:
+    if collection and not document:
+        return drop_partition(conn, collection)
     conditions = []
     params = []
     if collection:
-        conditions.append("collection = %s")
+        conditions.append("collection_id = (SELECT collection_id FROM collections WHERE collection = %s)")
         params.append(collection)
     if document:
         conditions.append("document = %s")
@@ -220,10 +750,27 @@ def delete_chunks(conn, collection: str | None, document: str | None) -> int:
 
     where = " AND ".join(conditions)
     with conn.cursor() as cur:
-        cur.execute(f"DELETE FROM documents WHERE {where}", params)
-        deleted = cur.rowcount
+        cur.execute(
+            f"""
+            DELETE FROM documents
+            WHERE document_id IN (SELECT document_id FROM collection_documents WHERE {where})
+            RETURNING collection_id, document_id, id
+            """,
+            params
+        )
+        affected = cur.fetchall()
+        ids_by_collection: dict[int, list[int]] = {}
+        for collection_id, _, chunk_id in affected:
+            ids_by_collection.setdefault(collection_id, []).append(chunk_id)
+        for collection_id, ids in ids_by_collection.items():
+            cur.execute("DELETE FROM chunk_vectors WHERE collection_id = %s AND id = ANY(%s)", (collection_id, ids))
+        for document_id in {document_id for _, document_id, _ in affected}:
+            forget_document(cur, document_id)
+        cur.execute("SELECT collection FROM collections WHERE collection_id = ANY(%s)", (list(ids_by_collection),))
+        for (coll,) in cur.fetchall():
+            bump_generation(cur, coll)
     conn.commit()
-    return deleted
+    return len(affected)
 
 
 # Format sparse vector for pgvector sparsevec type: '{idx1:val1,idx2:val2}/dimensions'
@@ -234,56 +781,185 @@ def format_sparsevec(sparse: dict, dimensions: int = 30522) -> str:
 
 # Store chunks with dense embeddings in PostgreSQL; sparse_embedding stays NULL for new chunks.
 # Returns count of chunks SKIPPED because the embedding model returned a NULL vector.
-def store_chunks(conn, chunks: list[dict], embeddings: list[list[float]], sparse_embeddings: list[dict] | None = None) -> int:
+# The batch goes to Postgres as one binary COPY (see copy_chunks) — no per-row round trips,
+# no text literals for the 4096 floats per chunk.
+def store_chunks(conn, chunks: list[dict], embeddings: list[np.ndarray | None], sparse_embeddings: list[dict] | None = None) -> int:
+    collection_ids = {collection: ensure_partition(conn, collection) for collection in {c["collection"] for c in chunks}}
     skipped = 0
+    document_ids: dict[tuple[str, str], int] = {}
+    stored: dict[int, list[int]] = {}  # document_id → [collection_id, inserted, total_chunks]
+    rows = []
     with conn.cursor() as cur:
         for i, (chunk, embedding) in enumerate(zip(chunks, embeddings)):
-            if embedding is None or all(v is None for v in embedding):
+            if embedding is None:
                 logging.warning(f"NULL embedding skipped: collection={chunk['collection']} document={chunk['document']} chunk_index={chunk['chunk_index']}")
                 skipped += 1
                 continue
-            sparse_val = format_sparsevec(sparse_embeddings[i]) if sparse_embeddings else None
-            cur.execute(
-                """
-                INSERT INTO documents (content, collection, document, chunk_index, total_chunks, embedding, sparse_embedding)
-                VALUES (%s, %s, %s, %s, %s, %s, %s)
-                """,
-                (
-                    chunk["content"],
-                    chunk["collection"],
-                    chunk["document"],
-                    chunk["chunk_index"],
-                    chunk["total_chunks"],
-                    embedding,
-                    sparse_val
-                )
-            )
+            collection_id = collection_ids[chunk["collection"]]
+            key = (chunk["collection"], chunk["document"])
+            if key not in document_ids:
+                document_ids[key] = resolve_document(cur, collection_id, chunk["document"])
+            document_id = document_ids[key]
+            rows.append((
+                collection_id,
+                document_id,
+                chunk["content"],
+                chunk["chunk_index"],
+                chunk["total_chunks"],
+                embedding,
+                sparse_embeddings[i] if sparse_embeddings else None,
+            ))
+            counts = stored.setdefault(document_id, [collection_id, 0, 0])
+            counts[1] += 1
+            counts[2] = max(counts[2], chunk["total_chunks"])
+        if rows:
+            copy_chunks(cur, rows)
+        for document_id, (collection_id, inserted, total) in stored.items():
+            record_chunks(cur, collection_id, document_id, inserted, total, EMBEDDING_MODEL, VECTOR_DIMENSION)
+        for collection in {c["collection"] for c in chunks}:
+            bump_generation(cur, collection)
     conn.commit()
     if skipped:
         logging.warning(f"Skipped {skipped} chunks with NULL embeddings")
     return skipped
 
 
-# Fetch chunks with NULL sparse_embedding for backfill
-def fetch_null_sparse(conn, collection: str) -> list[tuple]:
+# Bulk-insert rows (collection_id, document_id, content, chunk_index, total_chunks, embedding,
+# sparse) in the caller's transaction: COPY ... FROM STDIN (FORMAT binary) into a session
+# temp table, then one INSERT moves them into documents + chunk_vectors. The staged CTE is
+# materialized, so each row draws its id from documents_id_seq once and both tables share it.
+# Staging stays `vector` whatever EMBEDDING_STORAGE is — the insert casts to halfvec — and
+# plain derived columns (embedding_mrl / embedding_bin) are computed in the same INSERT.
+def copy_chunks(cur, rows: list[tuple]) -> None:
+    cur.execute("""
+        CREATE TEMP TABLE IF NOT EXISTS chunk_staging (
+            collection_id INTEGER,
+            document_id INTEGER,
+            content TEXT,
+            chunk_index INTEGER,
+            total_chunks INTEGER,
+            embedding vector,
+            sparse_embedding sparsevec
+        )
+    """)
+    cur.execute("TRUNCATE chunk_staging")
+    cur.copy_expert("COPY chunk_staging FROM STDIN (FORMAT binary)", io.BytesIO(encode_copy_rows(rows)))
+    # Lock first, then read the catalog: a concurrent build-ann-index either added its column
+    # before (this insert fills it) or waits for this transaction (its backfill sees the rows)
+    cur.execute("LOCK TABLE ONLY chunk_vectors IN ROW EXCLUSIVE MODE")
+    columns, values = derived_insert(cur, "embedding")
+    cur.execute(f"""
+        WITH staged AS MATERIALIZED (
+            SELECT nextval('documents_id_seq')::integer AS id, * FROM chunk_staging
+        ), inserted AS (
+            INSERT INTO documents (id, collection_id, document_id, content, chunk_index, total_chunks)
+            SELECT id, collection_id, document_id, content, chunk_index, total_chunks FROM staged
+        )
+        INSERT INTO chunk_vectors (id, collection_id, document_id, embedding, sparse_embedding{columns})
+        SELECT id, collection_id, document_id, embedding, sparse_embedding{values} FROM staged
+    """)
+
+
+# PGCOPY binary stream for copy_chunks: header, one 7-field tuple per row, trailer
+def encode_copy_rows(rows: list[tuple]) -> bytes:
+    int4 = struct.Struct(">ii")  # field length 4 + value
+    parts = [b"PGCOPY\n\xff\r\n\x00", struct.pack(">ii", 0, 0)]
+    for collection_id, document_id, content, chunk_index, total_chunks, embedding, sparse in rows:
+        text = content.encode()
+        vector = encode_vector(embedding)
+        parts += [
+            struct.pack(">h", 7),
+            int4.pack(4, collection_id),
+            int4.pack(4, document_id),
+            struct.pack(">i", len(text)), text,
+            int4.pack(4, chunk_index),
+            int4.pack(4, total_chunks),
+            struct.pack(">i", len(vector)), vector,
+        ]
+        if sparse is None:
+            parts.append(struct.pack(">i", -1))
+        else:
+            packed = encode_sparsevec(sparse)
+            parts += [struct.pack(">i", len(packed)), packed]
+    parts.append(struct.pack(">h", -1))
+    return b"".join(parts)
+
+
+# pgvector `vector` binary form: dim (int16), unused (int16), big-endian float4 values
+def encode_vector(embedding) -> bytes:
+    values = np.asarray(embedding, dtype=">f4")
+    return struct.pack(">HH", len(values), 0) + values.tobytes()
+
+
+# pgvector `sparsevec` binary form: dim, nnz, unused (int32), 0-based indices, float4 values.
+# Same vector format_sparsevec describes: its 1-based text indices shift down by one, entries
+# are sorted by index and zeros dropped (the text parser does both, binary input requires it).
+def encode_sparsevec(sparse: dict, dimensions: int = 30522) -> bytes:
+    indices = np.asarray(sparse["indices"], dtype=np.int64) - 1
+    values = np.asarray(sparse["values"], dtype=np.float32)
+    order = np.argsort(indices, kind="stable")
+    indices, values = indices[order], values[order]
+    keep = values != 0
+    indices, values = indices[keep], values[keep]
+    return (
+        struct.pack(">iii", dimensions, len(indices), 0)
+        + indices.astype(">i4").tobytes()
+        + values.astype(">f4").tobytes()
+    )
+
+
+# Count chunks with NULL sparse_embedding (backfill progress total)
+def count_null_sparse(conn, collection: str) -> int:
     with conn.cursor() as cur:
         cur.execute(
             """
-            SELECT id, content FROM documents
-            WHERE collection = %s AND sparse_embedding IS NULL
-            ORDER BY id
+            SELECT COUNT(*) FROM chunk_vectors
+            WHERE collection_id = (SELECT collection_id FROM collections WHERE collection = %s)
+              AND sparse_embedding IS NULL
             """,
             (collection,)
         )
+        return cur.fetchone()[0]
+
+
+# Next page of chunks with NULL sparse_embedding after after_id (keyset on the (id, collection_id)
+# primary key — each page is an index range scan, independent of how far the backfill got)
+def fetch_null_sparse(conn, collection: str, after_id: int, limit: int) -> list[tuple]:
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            SELECT d.id, d.content
+            FROM chunk_vectors v
+            JOIN documents d ON d.id = v.id AND d.collection_id = v.collection_id
+            WHERE v.collection_id = (SELECT collection_id FROM collections WHERE collection = %s)
+              AND v.sparse_embedding IS NULL
+              AND v.id > %s
+            ORDER BY v.id
+            LIMIT %s
+            """,
+            (collection, after_id, limit)
+        )
         return cur.fetchall()
 
 
-# Update sparse_embedding for given chunk IDs
-def update_sparse(conn, ids: list[int], sparse_embeddings: list[dict]) -> None:
+# Update sparse_embedding for given chunk IDs of a collection in one set-based UPDATE;
+# bumps its generation (sparse candidates feed HYBRID_SPARSE searches, so cached results must invalidate)
+def update_sparse(conn, collection: str, ids: list[int], sparse_embeddings: list[dict]) -> None:
+    rows = [(chunk_id, format_sparsevec(sparse)) for chunk_id, sparse in zip(ids, sparse_embeddings)]
     with conn.cursor() as cur:
-        for chunk_id, sparse in zip(ids, sparse_embeddings):
-            cur.execute(
-                "UPDATE documents SET sparse_embedding = %s WHERE id = %s",
-                (format_sparsevec(sparse), chunk_id)
-            )
+        # execute_values takes a single placeholder (the VALUES list) — the id goes in as a literal
+        cur.execute("SELECT collection_id FROM collections WHERE collection = %s", (collection,))
+        collection_id = cur.fetchone()[0]
+        execute_values(
+            cur,
+            sql.SQL("""
+                UPDATE chunk_vectors v SET sparse_embedding = u.sparse_embedding
+                FROM (VALUES %s) AS u(id, sparse_embedding)
+                WHERE v.id = u.id AND v.collection_id = {}
+            """).format(sql.Literal(collection_id)),
+            rows,
+            template="(%s, %s::sparsevec)",
+            page_size=max(len(rows), 1),
+        )
+        bump_generation(cur, collection)
     conn.commit()
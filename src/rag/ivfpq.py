@@ -0,0 +1,334 @@
+# INFRASTRUCTURE
+import logging
+import math
+import os
+from pathlib import Path
+
+import numpy as np
+
+from .db import get_connection
+from .segment_store import (
+    SCAN_BLOCK,
+    document_mask,
+    list_catalog_collections,
+    materialize_hits,
+    normalize,
+    score_segment,
+    segment_dir,
+    segment_lock,
+    sync_segment,
+    top_rows,
+)
+
+LOG_DIR = Path(__file__).parent / "logs"
+LOG_DIR.mkdir(exist_ok=True)
+
+logging.basicConfig(
+    filename=LOG_DIR / "ivfpq.log",
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+
+# Probed inverted lists per query — the speed/recall knob
+IVF_NPROBE = int(os.getenv("IVF_NPROBE", "32"))
+# PQ sub-quantizers (VECTOR_DIMENSION must be divisible); 256 centroids each → 1 byte per sub-vector
+IVF_M = int(os.getenv("IVF_M", "64"))
+# Collections smaller than this are served by the flat segment scan (no index needed)
+IVF_MIN_ROWS = int(os.getenv("IVF_MIN_ROWS", "100000"))
+# PQ candidates per requested result that get re-scored against the float16 segment rows
+IVF_REFINE = int(os.getenv("IVF_REFINE", "4"))
+IVF_TRAIN_SAMPLE = int(os.getenv("IVF_TRAIN_SAMPLE", "65536"))
+KMEANS_ITERATIONS = 10
+PQ_CENTROIDS = 256
+INDEX_FILE = "ivfpq.npz"
+
+# Loaded indexes per collection with their file's mtime, reloaded when the file is rewritten
+_open_indexes: dict[str, tuple[int, dict]] = {}
+
+
+# ORCHESTRATOR
+
+# IVF-PQ candidate generation over the collection's segment: probe IVF_NPROBE
+# coarse lists, score their PQ codes with one asymmetric distance table, re-score
+# the best top_k * IVF_REFINE against the float16 rows. Drop-in for search_vectors.
+# Collections without a usable index (or below IVF_MIN_ROWS) fall back to the flat scan;
+# rows appended since the index was encoded are scanned exactly.
+def search_ivfpq(
+    conn,
+    query_vector: list[float],
+    top_k: int,
+    collection: str | None = None,
+    document: str | None = None
+) -> list[dict]:
+    collections = [collection] if collection else list_catalog_collections(conn)
+    query = normalize(np.asarray(query_vector, dtype=np.float32))
+
+    hits = []
+    for coll in collections:
+        segment = sync_segment(conn, coll)
+        if segment["meta"]["count"] == 0:
+            continue
+        mask = document_mask(segment, document) if document else None
+        index = sync_index(coll, segment)
+        if index is None:
+            scores = score_segment(segment, query, mask)
+            rows = top_rows(scores, top_k)
+            scores = scores[rows]
+        else:
+            rows, scores = search_index(index, segment, query, top_k, IVF_NPROBE, mask)
+            indexed = index["count"]
+            if indexed < segment["meta"]["count"]:
+                tail = score_segment({"vectors": segment["vectors"][indexed:]}, query,
+                                     mask[indexed:] if mask is not None else None)
+                tail_rows = top_rows(tail, top_k)
+                rows = np.concatenate([rows, tail_rows + indexed])
+                scores = np.concatenate([scores, tail[tail_rows]])
+        hits.extend((float(s), coll, int(segment["ids"][r])) for r, s in zip(rows, scores))
+
+    hits.sort(key=lambda h: h[0], reverse=True)
+    return materialize_hits(conn, hits[:top_k])
+
+
+# Train (or re-encode) the IVF-PQ index of a collection from its segment
+def build_ivfpq_workflow(collection: str, nlist: int | None = None, m: int = IVF_M, retrain: bool = False) -> dict:
+    conn = get_connection()
+    segment = sync_segment(conn, collection)
+    conn.close()
+    with segment_lock(collection):
+        index = None if retrain else load_index(collection)
+        if index is None or index["centroids"].shape[1] != segment["meta"]["dim"]:
+            index = train_index(segment, nlist or default_nlist(segment["meta"]["count"]), m)
+        index = encode_segment(index, segment)
+        save_index(collection, index)
+    logging.info(
+        f"Built IVF-PQ {collection}: {index['count']} rows, nlist={len(index['centroids'])}, "
+        f"m={len(index['codebooks'])}, generation={index['generation']}"
+    )
+    return {"collection": collection, "chunks": int(index["count"]), "nlist": len(index["centroids"]),
+            "m": len(index["codebooks"]), "generation": int(index["generation"])}
+
+
+# FUNCTIONS
+
+# Coarse list count heuristic: ~4·sqrt(N), capped so training stays tractable
+def default_nlist(count: int) -> int:
+    return max(1, min(4096, int(4 * math.sqrt(count))))
+
+
+# Index usable for the segment, or None to use the flat scan. Searches never encode: an
+# index behind the segment still serves the rows it covers when the segment was only
+# appended to (search_ivfpq scans the rest exactly); after deletes, a rebuild or a storage
+# change it is skipped until `workflow.py sync-segments` / `build-ivfpq` re-encodes it.
+def sync_index(collection: str, segment: dict) -> dict | None:
+    if segment["meta"]["count"] < IVF_MIN_ROWS:
+        return None
+    index = current_index(collection)
+    if index is None:
+        logging.warning(f"No IVF-PQ index for {collection} — flat scan (run workflow.py build-ivfpq)")
+        return None
+    if index["generation"] != segment["meta"]["generation"] and not indexes_prefix(index, segment):
+        logging.warning(
+            f"IVF-PQ index for {collection} is stale (generation {index['generation']}, segment "
+            f"{segment['meta']['generation']}) — flat scan (run workflow.py sync-segments)"
+        )
+        return None
+    return index
+
+
+# Bring a stale index up to date with its trained centroids/codebooks (sync-segments):
+# appended rows are encoded incrementally, anything else re-encodes all rows.
+# Returns True if the index was rewritten; collections without an index are skipped.
+def refresh_index(collection: str, segment: dict) -> bool:
+    with segment_lock(collection):
+        index = load_index(collection)
+        if index is None or index["generation"] == segment["meta"]["generation"]:
+            return False
+        index = encode_segment(index, segment)
+        save_index(collection, index)
+    logging.info(f"Re-encoded IVF-PQ {collection}: {index['count']} rows (generation {index['generation']})")
+    return True
+
+
+# Loaded index of a collection, or None if it was never built. Reloaded only when the
+# file changed (build-ivfpq / sync-segments in another process), one stat per search.
+def current_index(collection: str) -> dict | None:
+    try:
+        mtime = index_path(collection).stat().st_mtime_ns
+    except FileNotFoundError:
+        return None
+    cached = _open_indexes.get(collection)
+    if cached is None or cached[0] != mtime:
+        cached = (mtime, load_index(collection))
+        _open_indexes[collection] = cached
+    return cached[1]
+
+
+# True if the index's rows are an unchanged prefix of the segment: only appends since it
+# was encoded (ids are never reused, so the last indexed id pins the prefix) and the same
+# stored embedding type
+def indexes_prefix(index: dict, segment: dict) -> bool:
+    indexed = int(index["count"])
+    return (
+        0 < indexed <= segment["meta"]["count"]
+        and int(segment["ids"][indexed - 1]) == int(index["max_id"])
+        and index.get("storage") == segment["meta"].get("storage", "")
+    )
+
+
+# Train coarse centroids (spherical-ish k-means on unit vectors) and per-subspace
+# PQ codebooks on the residuals of a random sample
+def train_index(segment: dict, nlist: int, m: int) -> dict:
+    count, dim = segment["meta"]["count"], segment["meta"]["dim"]
+    if dim % m:
+        raise ValueError(f"Vector dimension {dim} not divisible by IVF_M={m}")
+    rng = np.random.default_rng(0)
+    sample_rows = np.sort(rng.choice(count, size=min(count, IVF_TRAIN_SAMPLE), replace=False))
+    sample = np.asarray(segment["vectors"][sample_rows], dtype=np.float32)
+
+    centroids = kmeans(sample, min(nlist, len(sample)), rng)
+    residuals = sample - centroids[assign_nearest(sample, centroids)]
+    dsub = dim // m
+    codebooks = np.stack([
+        kmeans(residuals[:, j * dsub:(j + 1) * dsub], min(PQ_CENTROIDS, len(sample)), rng)
+        for j in range(m)
+    ])
+    logging.info(f"Trained IVF-PQ on {len(sample)} rows: nlist={len(centroids)}, m={m}, dsub={dsub}")
+    return {"centroids": centroids, "codebooks": codebooks, "generation": -1, "count": 0,
+            "list_offsets": np.zeros(len(centroids) + 1, dtype=np.int64),
+            "rows": np.empty(0, dtype=np.int64), "codes": np.empty((0, m), dtype=np.uint8)}
+
+
+# Lloyd's k-means with blockwise assignment (empty clusters re-seeded from random points)
+def kmeans(x: np.ndarray, k: int, rng: np.random.Generator) -> np.ndarray:
+    centroids = x[rng.choice(len(x), size=k, replace=False)].copy()
+    for _ in range(KMEANS_ITERATIONS):
+        labels = assign_nearest(x, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, x)
+        counts = np.bincount(labels, minlength=k)
+        empty = counts == 0
+        centroids[~empty] = sums[~empty] / counts[~empty, None]
+        if empty.any():
+            centroids[empty] = x[rng.choice(len(x), size=int(empty.sum()), replace=False)]
+    return centroids
+
+
+# Nearest centroid by L2: argmax(x·c − ‖c‖²/2), computed in SCAN_BLOCK row blocks
+def assign_nearest(x: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    half_norms = 0.5 * np.einsum("ij,ij->i", centroids, centroids)
+    labels = np.empty(len(x), dtype=np.int64)
+    for start in range(0, len(x), SCAN_BLOCK):
+        block = np.asarray(x[start:start + SCAN_BLOCK], dtype=np.float32)
+        labels[start:start + len(block)] = np.argmax(block @ centroids.T - half_norms, axis=1)
+    return labels
+
+
+# Coarse-assign and PQ-encode segment rows into the index's inverted lists.
+# Only rows past the indexed prefix are encoded when the segment was appended to.
+def encode_segment(index: dict, segment: dict) -> dict:
+    count = segment["meta"]["count"]
+    appended = indexes_prefix(index, segment)
+    start = int(index["count"]) if appended else 0
+
+    labels, codes = [], []
+    for block_start in range(start, count, SCAN_BLOCK):
+        block = np.asarray(segment["vectors"][block_start:block_start + SCAN_BLOCK], dtype=np.float32)
+        block_labels = assign_nearest(block, index["centroids"])
+        labels.append(block_labels)
+        codes.append(pq_encode(block - index["centroids"][block_labels], index["codebooks"]))
+    new_rows = np.arange(start, count, dtype=np.int64)
+    new_labels = np.concatenate(labels) if labels else np.empty(0, dtype=np.int64)
+    new_codes = np.concatenate(codes) if codes else np.empty((0, len(index["codebooks"])), dtype=np.uint8)
+
+    if appended:
+        old_labels = np.repeat(np.arange(len(index["centroids"])), np.diff(index["list_offsets"]))
+        new_rows = np.concatenate([index["rows"], new_rows])
+        new_labels = np.concatenate([old_labels, new_labels])
+        new_codes = np.concatenate([index["codes"], new_codes])
+
+    order = np.argsort(new_labels, kind="stable")
+    offsets = np.zeros(len(index["centroids"]) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(new_labels, minlength=len(index["centroids"])), out=offsets[1:])
+    return {**index, "rows": new_rows[order], "codes": new_codes[order], "list_offsets": offsets,
+            "generation": segment["meta"]["generation"], "count": count,
+            "max_id": int(segment["ids"][count - 1]) if count else 0,
+            "storage": segment["meta"].get("storage", "")}
+
+
+# Per-subspace nearest codeword for each residual row → (n, m) uint8 codes
+def pq_encode(residuals: np.ndarray, codebooks: np.ndarray) -> np.ndarray:
+    m, _, dsub = codebooks.shape
+    codes = np.empty((len(residuals), m), dtype=np.uint8)
+    for j in range(m):
+        codes[:, j] = assign_nearest(residuals[:, j * dsub:(j + 1) * dsub], codebooks[j])
+    return codes
+
+
+# Asymmetric distance computation: score = q·centroid + Σ_j q_j·codeword_j.
+# One (m, 256) lookup table per query serves every probed list (residual PQ with inner product).
+# Returns segment rows + exact float16 cosine of the refined candidates, best first.
+def search_index(
+    index: dict,
+    segment: dict,
+    query: np.ndarray,
+    top_k: int,
+    nprobe: int,
+    mask: np.ndarray | None
+) -> tuple[np.ndarray, np.ndarray]:
+    centroids, codebooks, offsets = index["centroids"], index["codebooks"], index["list_offsets"]
+    m, _, dsub = codebooks.shape
+    coarse = centroids @ query
+    probe = np.argpartition(-coarse, min(nprobe, len(coarse)) - 1)[:nprobe]
+    table = np.einsum("jkd,jd->jk", codebooks, query.reshape(m, dsub))
+
+    rows, approx = [], []
+    for lst in probe:
+        lo, hi = offsets[lst], offsets[lst + 1]
+        if lo == hi:
+            continue
+        list_rows = index["rows"][lo:hi]
+        scores = coarse[lst] + table[np.arange(m), index["codes"][lo:hi]].sum(axis=1)
+        if mask is not None:
+            keep = mask[list_rows]
+            list_rows, scores = list_rows[keep], scores[keep]
+        rows.append(list_rows)
+        approx.append(scores)
+    if not rows:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+    rows, approx = np.concatenate(rows), np.concatenate(approx)
+
+    k = min(top_k * IVF_REFINE, len(rows))
+    candidates = rows[np.argpartition(-approx, k - 1)[:k]]
+    candidates.sort()  # ascending row order → sequential memmap reads
+    exact = np.asarray(segment["vectors"][candidates], dtype=np.float32) @ query
+    best = np.argsort(-exact)[:top_k]
+    return candidates[best], exact[best]
+
+
+# Index file sits beside (not inside) the segment directory, so trained codebooks
+# survive segment rebuilds — sync-segments re-encodes against them
+def index_path(collection: str) -> Path:
+    seg_dir = segment_dir(collection)
+    return seg_dir.with_name(f"{seg_dir.name}.{INDEX_FILE}")
+
+
+# Load a persisted index, or None if it was never built
+def load_index(collection: str) -> dict | None:
+    path = index_path(collection)
+    if not path.exists():
+        return None
+    with np.load(path) as data:
+        index = {key: data[key] for key in data.files}
+    for key in ("generation", "count", "max_id"):
+        index[key] = int(index[key])
+    if "storage" in index:
+        index["storage"] = str(index["storage"])
+    return index
+
+
+# Persist atomically (tmp + rename) so concurrent readers never load a partial file
+def save_index(collection: str, index: dict) -> None:
+    path = index_path(collection)
+    tmp = path.with_name(f"{path.name}.tmp{os.getpid()}.npz")
+    np.savez(tmp, **{key: np.asarray(value) for key, value in index.items()})
+    os.replace(tmp, path)
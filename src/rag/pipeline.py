@@ -0,0 +1,162 @@
+# INFRASTRUCTURE
+import logging
+import os
+import queue
+import threading
+from typing import Callable, Iterable
+
+from .db import get_connection
+from .embedding_cache import embed_cached
+from .indexer import EMBED_WINDOW, delete_chunks, store_chunks
+
+# Embedding requests in flight at once — the next request is already queued at the server
+# while the previous response is decoded and the writer commits (1 = strictly one by one)
+EMBED_WORKERS = int(os.getenv("EMBED_WORKERS", "2"))
+# Bounded hand-off between stages (items ≈ windows); caps memory and chunker run-ahead
+PIPELINE_QUEUE_DEPTH = int(os.getenv("PIPELINE_QUEUE_DEPTH", "4"))
+INDEX_PREFIX = "search_document: "
+
+_DONE = object()   # end-of-stream marker, one per embed worker
+
+
+class _Stopped(Exception):
+    pass
+
+
+# ORCHESTRATOR
+
+# Index documents through three stages connected by bounded queues:
+#   producer  (thread)         — pulls (key, chunks) from `documents` (so chunking / JSON loading
+#                                in that iterable runs here) and cuts EMBED_WINDOW windows
+#   embedders (EMBED_WORKERS)  — embed_cached per window (token-packed requests), each with
+#                                its own connection
+#   writer    (calling thread) — own write connection: replaces a document's old chunks, stores
+#                                its windows, then calls on_document(key, indexed, total)
+# The writer applies items in production order, so the stored rows (ids included) match the
+# sequential loop. A failure in any stage stops all of them and is re-raised here.
+# Returns chunks indexed per key (NULL embeddings skipped).
+def index_pipeline(
+    documents: Iterable[tuple[str, list[dict]]],
+    on_document: Callable[[str, int, int], None] | None = None,
+) -> dict[str, int]:
+    workers = max(EMBED_WORKERS, 1)
+    embed_q: queue.Queue = queue.Queue(PIPELINE_QUEUE_DEPTH)
+    write_q: queue.Queue = queue.Queue(PIPELINE_QUEUE_DEPTH)
+    stop = threading.Event()
+    errors: list[BaseException] = []
+    results: dict[str, int] = {}
+
+    def run(stage: Callable[..., None], *args) -> None:
+        try:
+            stage(*args)
+        except _Stopped:
+            pass
+        except BaseException as e:
+            errors.append(e)
+            stop.set()
+
+    threads = [threading.Thread(target=run, args=(produce, documents, embed_q, stop, workers), daemon=True)]
+    threads += [threading.Thread(target=run, args=(embed, embed_q, write_q, stop), daemon=True) for _ in range(workers)]
+    for t in threads:
+        t.start()
+    try:
+        run(write, write_q, stop, workers, on_document, results)
+    finally:
+        stop.set()
+        for t in threads:
+            t.join()
+    if errors:
+        raise errors[0]
+    return results
+
+
+# FUNCTIONS
+
+# Producer stage: per document a "start" item, its windows, and an "end" item, numbered in order
+def produce(documents: Iterable[tuple[str, list[dict]]], embed_q: queue.Queue, stop: threading.Event, workers: int) -> None:
+    seq = 0
+    for key, chunks in documents:
+        items = [("start", chunks)]
+        items += [("window", chunks[i:i + EMBED_WINDOW]) for i in range(0, len(chunks), EMBED_WINDOW)]
+        items.append(("end", chunks))
+        for kind, payload in items:
+            put(embed_q, (seq, kind, key, payload), stop)
+            seq += 1
+    for _ in range(workers):
+        put(embed_q, _DONE, stop)
+
+
+# Embed stage: windows get their embeddings, start/end items pass through
+def embed(embed_q: queue.Queue, write_q: queue.Queue, stop: threading.Event) -> None:
+    conn = get_connection(purpose="write")
+    try:
+        while (item := get(embed_q, stop)) is not _DONE:
+            seq, kind, key, chunks = item
+            embeddings = embed_cached(conn, [c["content"] for c in chunks], INDEX_PREFIX) if kind == "window" else None
+            put(write_q, (seq, kind, key, chunks, embeddings), stop)
+        put(write_q, _DONE, stop)
+    finally:
+        conn.close()
+
+
+# Writer stage: apply items strictly in sequence order (faster embeds wait in `pending`)
+def write(write_q: queue.Queue, stop: threading.Event, workers: int,
+          on_document: Callable[[str, int, int], None] | None, results: dict[str, int]) -> None:
+    conn = get_connection(purpose="write")
+    pending: dict[int, tuple] = {}
+    next_seq = 0
+    finished = 0
+    stored = indexed = 0
+    try:
+        while finished < workers:
+            item = get(write_q, stop)
+            if item is _DONE:
+                finished += 1
+                continue
+            pending[item[0]] = item
+            while next_seq in pending:
+                _, kind, key, chunks, embeddings = pending.pop(next_seq)
+                next_seq += 1
+                if kind == "start":
+                    stored = indexed = 0
+                    total = len(chunks)
+                    for collection, doc in sorted({(c["collection"], c["document"]) for c in chunks}):
+                        deleted = delete_chunks(conn, collection, doc)
+                        if deleted > 0:
+                            print(f"Deleted {deleted} existing chunks for {collection}/{doc}")
+                elif kind == "window":
+                    skipped = store_chunks(conn, chunks, embeddings)
+                    stored += len(chunks)
+                    indexed += len(chunks) - skipped
+                    suffix = f" ({skipped} NULL skipped)" if skipped else ""
+                    print(f"Indexed {stored}/{total} chunks{suffix}")
+                else:
+                    results[key] = indexed
+                    logging.info(f"Indexed {indexed}/{total} chunks from {key} ({total - indexed} skipped)")
+                    if on_document:
+                        on_document(key, indexed, total)
+    finally:
+        conn.close()
+
+
+# Queue put that gives up once another stage failed (never blocks on a dead consumer)
+def put(q: queue.Queue, item, stop: threading.Event) -> None:
+    while True:
+        if stop.is_set():
+            raise _Stopped
+        try:
+            q.put(item, timeout=0.5)
+            return
+        except queue.Full:
+            pass
+
+
+# Queue get that gives up once another stage failed
+def get(q: queue.Queue, stop: threading.Event):
+    while True:
+        if stop.is_set():
+            raise _Stopped
+        try:
+            return q.get(timeout=0.5)
+        except queue.Empty:
+            pass
@@ -1,12 +1,14 @@
 # INFRASTRUCTURE
 import logging
 import os
+import struct
 from pathlib import Path
 
-import httpx
 from dotenv import load_dotenv
 
-from .server_manager import ensure_ready, find_server_url, _touch_state_file
+from .cache import cache_get_many, cache_key, cache_put_many
+from .http_clients import post_json
+from .server_manager import ensure_ready, find_server_url, served_model, _touch_state_file
 
 load_dotenv()
 
@@ -19,23 +21,58 @@ logging.basicConfig(
     format='%(asctime)s - %(levelname)s - %(message)s'
 )
 
+# Reranker identity in score-cache keys. Unset = the GGUF stem of the local preset that scores
+# (reranker_identity), so 0.6B and 8B scores never share keys; required when RERANKER_URL
+# points at an external server
+RERANKER_MODEL = os.getenv("RERANKER_MODEL")
+# (query, chunk) relevance scores kept in the shared on-disk cache (LRU, 8 bytes each)
+RERANK_CACHE_SIZE = int(os.getenv("RERANK_CACHE_SIZE", "200000"))
+
 
 # ORCHESTRATOR
+# Cross-encoder scores are per (query, chunk) pair, so pairs scored before (any process)
+# come from the cache; only the rest go to /v1/rerank — a full hit never starts the server.
 def rerank_workflow(query: str, documents: list[dict], top_k: int) -> list[dict]:
-    ensure_ready("reranker")
     contents = [doc['content'] for doc in documents]
-    ranked = rerank_documents(query, contents)
+    model = reranker_identity()
+    keys = [cache_key(model, query, content) for content in contents]
+    cached = cache_get_many("rerank_scores", list(set(keys)))
+    scores = {i: struct.unpack("d", cached[key])[0] for i, key in enumerate(keys) if key in cached}
+
+    missing = [i for i in range(len(contents)) if i not in scores]
+    if missing:
+        ensure_ready("reranker")
+        ranked = rerank_documents(query, [contents[i] for i in missing])
+        fresh = {}
+        for item in ranked:
+            i = missing[item['index']]
+            scores[i] = item['relevance_score']
+            fresh[keys[i]] = struct.pack("d", item['relevance_score'])
+        cache_put_many("rerank_scores", fresh, RERANK_CACHE_SIZE)
+
     results = []
-    for item in ranked[:top_k]:
-        doc = documents[item['index']].copy()
-        doc['score'] = round(item['relevance_score'], 6)
+    for i in sorted(scores, key=lambda i: scores[i], reverse=True)[:top_k]:
+        doc = documents[i].copy()
+        doc['score'] = round(scores[i], 6)
         results.append(doc)
-    logging.info(f"Reranked {len(documents)} docs to top {top_k} for '{query[:50]}...'")
+    logging.info(f"Reranked {len(documents)} docs ({len(documents) - len(missing)} cached) to top {top_k} for '{query[:50]}...'")
     return results
 
 
 # FUNCTIONS
 
+# Model whose scores a rerank call gets, derived offline (no request, no fallback key): RERANKER_MODEL
+# if set, else served_model — the preset on RERANKER_URL's port, or the running / default variant
+def reranker_identity() -> str:
+    if RERANKER_MODEL:
+        return RERANKER_MODEL
+    url = os.getenv("RERANKER_URL")
+    model = served_model("reranker", url)
+    if model is None:
+        raise RuntimeError(f"RERANKER_URL={url} is no local reranker preset — set RERANKER_MODEL to the model it serves")
+    return model
+
+
 # Resolve reranker URL: env override → state-file discovery → error
 def _rerank_url() -> str:
     env = os.getenv("RERANKER_URL")
@@ -53,9 +90,10 @@ def _rerank_url() -> str:
 def rerank_documents(query: str, contents: list[str]) -> list[dict]:
     url = _rerank_url()
     _touch_state_file(int(url.split(":")[2].split("/")[0]))
-    response = httpx.post(
+    response = post_json(
+        "reranker",
         url,
-        json={
+        {
             "query": query,
             "documents": contents,
             "top_n": len(contents)
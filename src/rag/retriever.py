@@ -1,11 +1,31 @@
 # INFRASTRUCTURE
+import json
 import logging
+import os
 from pathlib import Path
 
+import numpy as np
+
+from .cache import cache_get, cache_key, cache_put, cache_scan, cache_touch
+from .catalog import generation_tag
 from .db import get_connection, validate_collection, query_collections, query_documents, query_progress, fetch_chunk_range
-from .search_primitives import embed_query, search_vectors
+from .embedder import embedding_identity
+from .indexer import BINARY_QUANTIZATION, EMBEDDING_STORAGE, MRL_DIMENSION, VECTOR_DIMENSION
+from .ivfpq import IVF_M, IVF_MIN_ROWS, IVF_NPROBE, IVF_REFINE, IVF_TRAIN_SAMPLE
+from .search_primitives import (
+    ANN_OVERSAMPLE,
+    BINARY_CANDIDATES,
+    DEFAULT_QUERY_PREFIX,
+    DENSE_SEARCH_MODE,
+    HNSW_EF_SEARCH,
+    embed_query,
+    embed_query_sparse,
+    normalize_query,
+    search_dense,
+    search_sparse,
+)
 from .formatting import format_results, format_collections, format_documents, format_progress
-from .reranker import rerank_workflow
+from .reranker import rerank_workflow, reranker_identity
 
 LOG_DIR = Path(__file__).parent / "logs"
 LOG_DIR.mkdir(exist_ok=True)
@@ -17,6 +37,20 @@ logging.basicConfig(
 )
 
 RERANK_CANDIDATES = 30
+# Add SPLADE candidates (indexed sparse search) to the dense pool before reranking.
+# Off by default: Phase A showed no gain with the reranker active (decisions/retrieval03_fusion.md).
+HYBRID_SPARSE = os.getenv("HYBRID_SPARSE", "0") == "1"
+# Final result lists kept in the shared on-disk cache (LRU), validated against collection generations
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", "2000"))
+# Semantic cache: a hybrid search whose query embedding is at least this cosine-similar to a
+# recent query of the same scope (collection, filter, config, generation) reuses its reranked
+# results — no DB scan, no reranker. >= 1 disables it. Off by default: no threshold has been
+# shown to serve only right answers (dev/retrieval/A_semantic_cache_eval.py, decisions/retrieval02_search.md).
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "1"))
+# Recent queries compared per scope (most recently used first)
+SEMANTIC_CACHE_QUERIES = int(os.getenv("SEMANTIC_CACHE_QUERIES", "64"))
+# Total bytes of remembered query vectors, all scopes (LRU; 16 KB per 4096-d query)
+SEMANTIC_CACHE_BYTES = int(os.getenv("SEMANTIC_CACHE_BYTES", str(32 * 1024 * 1024)))
 
 
 # ORCHESTRATOR
@@ -31,9 +65,17 @@ def search_workflow(
     conn = get_connection()
     if collection:
         validate_collection(conn, collection)
+    key = result_cache_key("search", query, collection, document, top_k)
+    tag = generation_tag(conn, collection)
+    results = cached_results(key, tag)
+    if results is not None:
+        conn.close()
+        logging.info(f"Search '{query[:50]}...' returned {len(results)} results (cached)")
+        return results
     query_vector = embed_query(query)
-    results = search_vectors(conn, query_vector, top_k, collection, document)
+    results = search_dense(conn, query_vector, top_k, collection, document)
     conn.close()
+    store_results(key, tag, results)
     logging.info(f"Search '{query[:50]}...' returned {len(results)} results")
     return results
 
@@ -85,17 +127,126 @@ def search_hybrid_workflow(
     conn = get_connection()
     if collection:
         validate_collection(conn, collection)
+    key = result_cache_key("hybrid", query, collection, document, 12)
+    tag = generation_tag(conn, collection)
+    results = cached_results(key, tag)
+    if results is not None:
+        conn.close()
+        logging.info(f"Hybrid search '{query[:50]}...' returned {len(results)} results (cached)")
+        return results
     query_vector = embed_query(query)
-    vector_results = search_vectors(conn, query_vector, RERANK_CANDIDATES, collection, document)
+    scope = result_cache_key("semantic", "", collection, document, 12)
+    results = semantic_lookup(scope, tag, query_vector)
+    if results is not None:
+        conn.close()
+        store_results(key, tag, results)
+        logging.info(f"Hybrid search '{query[:50]}...' returned {len(results)} results (semantic cache)")
+        return results
+    candidates = search_dense(conn, query_vector, RERANK_CANDIDATES, collection, document)
+    sparse_added = 0
+    if HYBRID_SPARSE:
+        sparse_results = search_sparse(conn, embed_query_sparse(query), RERANK_CANDIDATES, collection, document)
+        candidates, sparse_added = merge_candidates(candidates, sparse_results)
     conn.close()
-    results = rerank_workflow(query, vector_results, 12)
+    results = rerank_workflow(query, candidates, 12)
     results = [r for r in results if r['score'] > 0]
-    logging.info(f"Hybrid search '{query[:50]}...' returned {len(results)} results (dense+rerank, candidates={RERANK_CANDIDATES})")
+    store_results(key, tag, results)
+    semantic_store(scope, tag, key, query_vector)
+    mode = "dense+sparse+rerank" if HYBRID_SPARSE else "dense+rerank"
+    logging.info(f"Hybrid search '{query[:50]}...' returned {len(results)} results ({mode}, dense_mode={DENSE_SEARCH_MODE}, candidates={len(candidates)}, sparse_added={sparse_added})")
     return results
 
 
 # FUNCTIONS
 
+# Result-cache key: workflow, normalized query, filters, and every setting that changes the results
+def result_cache_key(workflow: str, query: str, collection: str | None, document: str | None, top_k: int) -> str:
+    return cache_key(workflow, normalize_query(query), collection or "", document or "", str(top_k), *map(str, ranking_config()))
+
+
+# Every setting that changes which chunks a search returns or their order: query embedding
+# (served model + truncation context, prefix), stored vectors (dimension, storage, MRL, binary), each dense
+# mode's knobs, the hybrid/sparse toggle and the reranker. All of them, whatever mode is
+# active — a stale entry must never survive switching a knob back and forth. Config and
+# state files only: a hit makes no server call and keys the same whether servers are up.
+def ranking_config() -> list:
+    return [
+        embedding_identity(), DEFAULT_QUERY_PREFIX,
+        VECTOR_DIMENSION, EMBEDDING_STORAGE, MRL_DIMENSION, BINARY_QUANTIZATION,
+        DENSE_SEARCH_MODE, ANN_OVERSAMPLE, HNSW_EF_SEARCH, BINARY_CANDIDATES,
+        IVF_NPROBE, IVF_REFINE, IVF_MIN_ROWS, IVF_M, IVF_TRAIN_SAMPLE,
+        HYBRID_SPARSE, RERANK_CANDIDATES, reranker_identity(),
+    ]
+
+
+# Cached results for key if they were computed at the current generation tag, else None.
+# The tag is read before searching, so a write racing a search only ever causes a miss.
+def cached_results(key: str, tag: str) -> list[dict] | None:
+    cached = cache_get("search_results", key)
+    if cached is None:
+        return None
+    entry = json.loads(cached)
+    return entry["results"] if entry["tag"] == tag else None
+
+
+# Store results under key, tagged with the generation tag they were computed at
+def store_results(key: str, tag: str, results: list[dict]) -> None:
+    cache_put("search_results", key, json.dumps({"tag": tag, "results": results}).encode(), RESULT_CACHE_SIZE)
+
+
+# Results of the most similar recent query in scope whose cosine similarity reaches
+# SEMANTIC_CACHE_THRESHOLD and whose exact-result entry is still cached at the current tag
+def semantic_lookup(scope: str, tag: str, query_vector: list[float]) -> list[dict] | None:
+    if SEMANTIC_CACHE_THRESHOLD >= 1:
+        return None
+    query = normalize_vector(query_vector)
+    rows = [(key, value) for key, value in cache_scan("semantic_queries", semantic_prefix(scope, tag), SEMANTIC_CACHE_QUERIES)
+            if len(value) == query.nbytes]
+    if not rows:
+        return None
+    vectors = np.frombuffer(b"".join(value for _, value in rows), dtype=np.float32).reshape(len(rows), -1)
+    similarities = vectors @ query
+    for i in np.argsort(-similarities):
+        if similarities[i] < SEMANTIC_CACHE_THRESHOLD:
+            break
+        results = cached_results(rows[i][0].rsplit(":", 1)[1], tag)
+        if results is not None:
+            cache_touch("semantic_queries", rows[i][0])
+            logging.info(f"Semantic cache hit: cosine {similarities[i]:.4f}")
+            return results
+    return None
+
+
+# Remember a query's unit embedding in its scope, one row per query pointing at its
+# exact-result entry (result_key) — a hit or store writes one small row, never the scope
+def semantic_store(scope: str, tag: str, result_key: str, query_vector: list[float]) -> None:
+    if SEMANTIC_CACHE_THRESHOLD >= 1:
+        return
+    # More vectors than result entries could never hit
+    cache_put("semantic_queries", semantic_prefix(scope, tag) + result_key,
+              normalize_vector(query_vector).tobytes(), RESULT_CACHE_SIZE, SEMANTIC_CACHE_BYTES)
+
+
+# Row-key prefix of a scope's queries at one generation tag — older generations never match
+def semantic_prefix(scope: str, tag: str) -> str:
+    return f"{scope}:{cache_key(tag)}:"
+
+
+# L2-normalized float32 copy of a query vector
+def normalize_vector(vector: list[float]) -> np.ndarray:
+    array = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(array)
+    return array / norm if norm else array
+
+
+# Union of dense and sparse candidates, deduplicated by chunk (dense first).
+# No score fusion — the reranker re-scores the pool. Returns (pool, sparse-only count).
+def merge_candidates(dense: list[dict], sparse: list[dict]) -> tuple[list[dict], int]:
+    seen = {(r['collection'], r['document'], r['chunk_index']) for r in dense}
+    added = [r for r in sparse if (r['collection'], r['document'], r['chunk_index']) not in seen]
+    return dense + added, len(added)
+
+
 # Merge chunks into continuous text with overlap deduplication
 def merge_chunks(chunks: list[dict]) -> str:
     if not chunks:
@@ -1,48 +1,174 @@
 # INFRASTRUCTURE
+import logging
+import os
+import unicodedata
 
-from .db import add_document_filter
-from .embedder import embed_workflow
+import numpy as np
+from psycopg2 import errors
+
+from .cache import cache_get, cache_key, cache_put
+from .db import add_collection_filter, add_document_filter
+from .embedder import embed_workflow, embedding_identity
+from .indexer import MRL_DIMENSION, VECTOR_DIMENSION, format_sparsevec
+from .sparse_embedder import sparse_embed_workflow
 
 DEFAULT_QUERY_PREFIX = "Instruct: Given a search query, retrieve relevant passages that answer the query\nQuery: "
 
+# Dense search path: "exact" (sequential scan over full vectors), "ann" (HNSW over embedding_mrl + exact rescore)
+# "binary" (Hamming prefilter over embedding_bin + exact rescore; needs BINARY_QUANTIZATION=1)
+# "numpy" (in-process exact scan over memory-mapped float16 segments, see segment_store.py)
+# or "ivfpq" (in-process IVF-PQ over the same segments for very large collections, see ivfpq.py).
+# ann / binary need `workflow.py build-ann-index` on existing tables; without the column they fall back to exact.
+DENSE_SEARCH_MODE = os.getenv("DENSE_SEARCH_MODE", "exact")
+# ANN candidates fetched per requested result before rescoring against the full vector
+ANN_OVERSAMPLE = int(os.getenv("ANN_OVERSAMPLE", "4"))
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", "200"))
+# Rows kept by the Hamming prefilter before exact cosine re-rank
+BINARY_CANDIDATES = int(os.getenv("BINARY_CANDIDATES", "300"))
+# Query embeddings kept in the shared on-disk cache (LRU; ~16 KB each at 4096 dims)
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "5000"))
+
 
 # FUNCTIONS
 
-# Embed search query with Qwen3 instruct prefix
+# Embed search query with Qwen3 instruct prefix. Repeated queries (any process) are served
+# from the on-disk cache — no HTTP call and no ensure_ready cold start of the embedding server.
+# Keyed on embedding_identity() (served model + context), so a swapped model never reuses a vector.
+# Vectors are kept as float32: what Postgres compares (vector is float4) and numpy scans anyway.
 def embed_query(query: str) -> list[float]:
-    embeddings = embed_workflow(query, prefix=DEFAULT_QUERY_PREFIX)
-    return embeddings[0]
+    key = cache_key(embedding_identity(), DEFAULT_QUERY_PREFIX, normalize_query(query))
+    cached = cache_get("query_embeddings", key)
+    if cached is not None:
+        return np.frombuffer(cached, dtype=np.float32).tolist()
+    vector = embed_workflow(query, prefix=DEFAULT_QUERY_PREFIX)[0]
+    if vector is None:
+        return None
+    cache_put("query_embeddings", key, vector.tobytes(), QUERY_CACHE_SIZE)
+    return vector.tolist()
 
 
-# Search vectors in PostgreSQL using cosine distance
-def search_vectors(
+# Cache-key form of a query: Unicode NFC + collapsed whitespace (case is kept — the model sees it)
+def normalize_query(query: str) -> str:
+    return " ".join(unicodedata.normalize("NFC", query).split())
+
+
+# Embed search query with SPLADE (no prefix — SPLADE is symmetric)
+def embed_query_sparse(query: str) -> dict:
+    return sparse_embed_workflow(query)[0]
+
+
+# Dense search entry point — dispatches on DENSE_SEARCH_MODE
+def search_dense(
     conn,
     query_vector: list[float],
     top_k: int,
     collection: str | None = None,
     document: str | None = None
 ) -> list[dict]:
-    where_clauses = []
-    where_params = []
+    if DENSE_SEARCH_MODE == "exact":
+        return search_vectors(conn, query_vector, top_k, collection, document)
+    if DENSE_SEARCH_MODE in ("ann", "binary"):
+        search = search_vectors_ann if DENSE_SEARCH_MODE == "ann" else search_vectors_binary
+        try:
+            return search(conn, query_vector, top_k, collection, document)
+        except errors.UndefinedColumn as e:
+            # Derived column not built yet (workflow.py build-ann-index) — exact scan instead of failing
+            conn.rollback()
+            logging.warning(f"DENSE_SEARCH_MODE={DENSE_SEARCH_MODE} unavailable ({e.diag.message_primary}); exact search")
+            return search_vectors(conn, query_vector, top_k, collection, document)
+    if DENSE_SEARCH_MODE == "numpy":
+        from .segment_store import search_segments
+        return search_segments(conn, query_vector, top_k, collection, document)
+    if DENSE_SEARCH_MODE == "ivfpq":
+        from .ivfpq import search_ivfpq
+        return search_ivfpq(conn, query_vector, top_k, collection, document)
+    raise ValueError(f"Unknown DENSE_SEARCH_MODE '{DENSE_SEARCH_MODE}'. Valid: exact, ann, binary, numpy, ivfpq")
 
-    if collection:
-        where_clauses.append("collection = %s")
-        where_params.append(collection)
-    if document:
-        where_clauses, where_params = add_document_filter(where_clauses, where_params, document)
 
-    where_sql = f"WHERE {' AND '.join(where_clauses)}" if where_clauses else ""
+# Search vectors in PostgreSQL using cosine distance. The scan runs over chunk_vectors;
+# documents is joined for the final top_k rows only. A halfvec `embedding` column
+# (EMBEDDING_STORAGE=halfvec) needs no change here: pgvector casts the vector literal
+# to halfvec implicitly, once per query.
+def search_vectors(
+    conn,
+    query_vector: list[float],
+    top_k: int,
+    collection: str | None = None,
+    document: str | None = None
+) -> list[dict]:
+    where_sql, where_params = vector_filter(collection, document)
     params = [query_vector] + where_params + [query_vector, top_k]
 
     with conn.cursor() as cur:
         cur.execute(
             f"""
-            SELECT content, collection, document, chunk_index,
-                   1 - (embedding <=> %s::vector) as score
-            FROM documents
-            {where_sql}
-            ORDER BY embedding <=> %s::vector
-            LIMIT %s
+            SELECT d.content, c.collection, cd.document, d.chunk_index, hits.score
+            FROM (
+                SELECT id, collection_id, 1 - (embedding <=> %s::vector) as score
+                FROM chunk_vectors
+                {where_sql}
+                ORDER BY embedding <=> %s::vector
+                LIMIT %s
+            ) hits
+            JOIN documents d ON d.id = hits.id AND d.collection_id = hits.collection_id
+            JOIN collections c ON c.collection_id = d.collection_id
+            JOIN collection_documents cd ON cd.document_id = d.document_id
+            ORDER BY hits.score DESC
+            """,
+            params
+        )
+        rows = cur.fetchall()
+
+    return [
+        {
+            "content": row[0],
+            "collection": row[1],
+            "document": row[2],
+            "chunk_index": row[3],
+            "score": round(float(row[4]), 4)
+        }
+        for row in rows
+    ]
+
+
+# Two-stage dense search: HNSW over the MRL-truncated halfvec column pulls
+# top_k * ANN_OVERSAMPLE candidate ids, which are re-scored by full-dimension cosine.
+# Iterative scan keeps filtered (collection/document) probes from returning short lists.
+def search_vectors_ann(
+    conn,
+    query_vector: list[float],
+    top_k: int,
+    collection: str | None = None,
+    document: str | None = None
+) -> list[dict]:
+    where_sql, where_params = vector_filter(collection, document)
+    candidates = top_k * ANN_OVERSAMPLE
+    mrl_vector = list(query_vector[:MRL_DIMENSION])
+    params = [query_vector] + where_params + [mrl_vector, candidates, top_k]
+
+    with conn.cursor() as cur:
+        cur.execute("SET LOCAL hnsw.ef_search = %s", (max(HNSW_EF_SEARCH, candidates),))
+        cur.execute("SET LOCAL hnsw.iterative_scan = relaxed_order")
+        cur.execute(
+            f"""
+            SELECT d.content, c.collection, cd.document, d.chunk_index, hits.score
+            FROM (
+                SELECT v.id, v.collection_id, 1 - (v.embedding <=> %s::vector) as score
+                FROM (
+                    SELECT id, collection_id
+                    FROM chunk_vectors
+                    {where_sql}
+                    ORDER BY embedding_mrl <=> %s::halfvec({MRL_DIMENSION})
+                    LIMIT %s
+                ) candidates
+                JOIN chunk_vectors v ON v.id = candidates.id AND v.collection_id = candidates.collection_id
+                ORDER BY score DESC
+                LIMIT %s
+            ) hits
+            JOIN documents d ON d.id = hits.id AND d.collection_id = hits.collection_id
+            JOIN collections c ON c.collection_id = d.collection_id
+            JOIN collection_documents cd ON cd.document_id = d.document_id
+            ORDER BY hits.score DESC
             """,
             params
         )
@@ -60,6 +186,126 @@ def search_vectors(
     ]
 
 
+# Two-stage dense search: Hamming-distance scan over the 512-byte embedding_bin column
+# keeps max(BINARY_CANDIDATES, top_k) ids; only those rows detoast the full vector for
+# the exact cosine re-rank.
+def search_vectors_binary(
+    conn,
+    query_vector: list[float],
+    top_k: int,
+    collection: str | None = None,
+    document: str | None = None
+) -> list[dict]:
+    where_sql, where_params = vector_filter(collection, document, ["embedding_bin IS NOT NULL"])
+    candidates = max(BINARY_CANDIDATES, top_k)
+    params = [query_vector] + where_params + [query_vector, candidates, top_k]
+
+    with conn.cursor() as cur:
+        cur.execute(
+            f"""
+            SELECT d.content, c.collection, cd.document, d.chunk_index, hits.score
+            FROM (
+                SELECT v.id, v.collection_id, 1 - (v.embedding <=> %s::vector) as score
+                FROM (
+                    SELECT id, collection_id
+                    FROM chunk_vectors
+                    {where_sql}
+                    ORDER BY embedding_bin <~> binary_quantize(%s::vector)::bit({VECTOR_DIMENSION})
+                    LIMIT %s
+                ) candidates
+                JOIN chunk_vectors v ON v.id = candidates.id AND v.collection_id = candidates.collection_id
+                ORDER BY score DESC
+                LIMIT %s
+            ) hits
+            JOIN documents d ON d.id = hits.id AND d.collection_id = hits.collection_id
+            JOIN collections c ON c.collection_id = d.collection_id
+            JOIN collection_documents cd ON cd.document_id = d.document_id
+            ORDER BY hits.score DESC
+            """,
+            params
+        )
+        rows = cur.fetchall()
+
+    return [
+        {
+            "content": row[0],
+            "collection": row[1],
+            "document": row[2],
+            "chunk_index": row[3],
+            "score": round(float(row[4]), 4)
+        }
+        for row in rows
+    ]
+
+
+# SPLADE search: HNSW probe over sparse_embedding by inner product (<#> is negative IP);
+# a sequential scan until backfill-splade has built the index. Chunks without a sparse
+# vector (not backfilled yet) are filtered out — their NULL distance would sort last and
+# fill the LIMIT. Score = raw SPLADE dot product.
+def search_sparse(
+    conn,
+    query_sparse: dict,
+    top_k: int,
+    collection: str | None = None,
+    document: str | None = None
+) -> list[dict]:
+    if not query_sparse["indices"]:
+        return []
+    where_sql, where_params = vector_filter(collection, document, ["sparse_embedding IS NOT NULL"])
+    sparse_val = format_sparsevec(query_sparse)
+    params = [sparse_val] + where_params + [sparse_val, top_k]
+
+    with conn.cursor() as cur:
+        cur.execute("SET LOCAL hnsw.ef_search = %s", (max(HNSW_EF_SEARCH, top_k),))
+        cur.execute("SET LOCAL hnsw.iterative_scan = relaxed_order")
+        cur.execute(
+            f"""
+            SELECT d.content, c.collection, cd.document, d.chunk_index, hits.score
+            FROM (
+                SELECT id, collection_id, -(sparse_embedding <#> %s::sparsevec) as score
+                FROM chunk_vectors
+                {where_sql}
+                ORDER BY sparse_embedding <#> %s::sparsevec
+                LIMIT %s
+            ) hits
+            JOIN documents d ON d.id = hits.id AND d.collection_id = hits.collection_id
+            JOIN collections c ON c.collection_id = d.collection_id
+            JOIN collection_documents cd ON cd.document_id = d.document_id
+            ORDER BY hits.score DESC
+            """,
+            params
+        )
+        rows = cur.fetchall()
+
+    return [
+        {
+            "content": row[0],
+            "collection": row[1],
+            "document": row[2],
+            "chunk_index": row[3],
+            "score": round(float(row[4]), 4)
+        }
+        for row in rows
+    ]
+
+
+# WHERE clause over chunk_vectors for the collection/document filters. Both resolve
+# names to integer ids through the catalog, so the scan compares integers only.
+def vector_filter(
+    collection: str | None,
+    document: str | None,
+    where_clauses: list | None = None
+) -> tuple[str, list]:
+    where_clauses = list(where_clauses or [])
+    where_params = []
+    if collection:
+        where_clauses, where_params = add_collection_filter(where_clauses, where_params, collection)
+    if document:
+        where_clauses, where_params = add_document_filter(where_clauses, where_params, document)
+    where_sql = f"WHERE {' AND '.join(where_clauses)}" if where_clauses else ""
+    return where_sql, where_params
+
+
 # BM25 keyword search using PostgreSQL full-text search
 def bm25_search(
     conn,
@@ -94,8 +340,7 @@ def _bm25_query(
     where_params = [tsquery]
 
     if collection:
-        where_clauses.append("collection = %s")
-        where_params.append(collection)
+        where_clauses, where_params = add_collection_filter(where_clauses, where_params, collection)
     if document:
         where_clauses, where_params = add_document_filter(where_clauses, where_params, document)
 
@@ -105,12 +350,18 @@ def _bm25_query(
     with conn.cursor() as cur:
         cur.execute(
             f"""
-            SELECT content, collection, document, chunk_index,
-                   ts_rank(tsv, to_tsquery('english', %s)) as score
-            FROM documents
-            WHERE {where_sql}
-            ORDER BY score DESC
-            LIMIT %s
+            SELECT hits.content, c.collection, cd.document, hits.chunk_index, hits.score
+            FROM (
+                SELECT content, collection_id, document_id, chunk_index,
+                       ts_rank(tsv, to_tsquery('english', %s)) as score
+                FROM documents
+                WHERE {where_sql}
+                ORDER BY score DESC
+                LIMIT %s
+            ) hits
+            JOIN collections c ON c.collection_id = hits.collection_id
+            JOIN collection_documents cd ON cd.document_id = hits.document_id
+            ORDER BY hits.score DESC
             """,
             params
         )
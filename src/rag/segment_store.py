@@ -0,0 +1,361 @@
+# INFRASTRUCTURE
+import fcntl
+import json
+import logging
+import os
+import re
+import shutil
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+from psycopg2.extensions import ISOLATION_LEVEL_REPEATABLE_READ
+
+from .catalog import get_generation
+from .db import fetch_chunks_by_id, get_connection
+from .indexer import VECTOR_DIMENSION, embedding_storage, partition_name
+from .server_utils import RAG_ROOT
+
+LOG_DIR = Path(__file__).parent / "logs"
+LOG_DIR.mkdir(exist_ok=True)
+
+logging.basicConfig(
+    filename=LOG_DIR / "segment_store.log",
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+
+# Per-collection segment directories: vectors.f16 (row-major, L2-normalized float16),
+# ids.i8 / chunks.i4 / docs.i4 (per-row sidecars), documents.json (doc-code → name),
+# meta.json (generation, count, max_id, dim, storage — written last, atomically).
+# storage is the chunk_vectors.embedding type the rows were exported from.
+SEGMENT_DIR = Path(os.getenv("SEGMENT_DIR", str(RAG_ROOT / "data" / "segments")))
+EXPORT_BATCH = 2048
+# Rows converted float16 → float32 per BLAS matrix-vector call (bounds scratch memory)
+SCAN_BLOCK = 16384
+
+_SIDECARS = {"ids.i8": np.int64, "chunks.i4": np.int32, "docs.i4": np.int32}
+
+# Opened (memory-mapped) segments per collection, reused while the generation matches
+_open_segments: dict[str, dict] = {}
+
+
+# ORCHESTRATOR
+
+# Exact cosine search over memory-mapped segments; drop-in for search_vectors.
+# Postgres stays the source of truth: each call compares the segment's generation
+# with the catalog and appends/rebuilds first if the collection changed.
+def search_segments(
+    conn,
+    query_vector: list[float],
+    top_k: int,
+    collection: str | None = None,
+    document: str | None = None
+) -> list[dict]:
+    collections = [collection] if collection else list_catalog_collections(conn)
+    query = normalize(np.asarray(query_vector, dtype=np.float32))
+
+    hits = []
+    for coll in collections:
+        segment = sync_segment(conn, coll)
+        if segment["meta"]["count"] == 0:
+            continue
+        mask = document_mask(segment, document) if document else None
+        scores = score_segment(segment, query, mask)
+        for row in top_rows(scores, top_k):
+            hits.append((float(scores[row]), coll, int(segment["ids"][row])))
+
+    hits.sort(key=lambda h: h[0], reverse=True)
+    return materialize_hits(conn, hits[:top_k])
+
+
+# Bring segments for one or all catalog collections up to date (pre-warm after indexing),
+# and re-encode their IVF-PQ indexes — searches only use the part still valid
+def sync_segments_workflow(collection: str | None = None) -> list[dict]:
+    from .ivfpq import refresh_index
+
+    conn = get_connection()
+    collections = [collection] if collection else list_catalog_collections(conn)
+    synced = []
+    for coll in collections:
+        segment = sync_segment(conn, coll)
+        refresh_index(coll, segment)
+        meta = segment["meta"]
+        synced.append({"collection": coll, "chunks": meta["count"], "generation": meta["generation"]})
+    conn.close()
+    return synced
+
+
+# FUNCTIONS
+
+# All non-empty collections known to the catalog
+def list_catalog_collections(conn) -> list[str]:
+    with conn.cursor() as cur:
+        cur.execute("SELECT collection FROM collections WHERE chunk_count > 0 ORDER BY collection")
+        return [row[0] for row in cur.fetchall()]
+
+
+# Return an open segment for the collection at its current generation,
+# appending or rebuilding the on-disk files if they are stale.
+def sync_segment(conn, collection: str) -> dict:
+    generation = get_generation(conn, collection)
+    cached = _open_segments.get(collection)
+    if cached and cached["meta"]["generation"] == generation:
+        return cached
+
+    seg_dir = segment_dir(collection)
+    meta = read_meta(seg_dir)
+    if not is_current(meta, generation):
+        with segment_lock(collection):
+            meta = read_meta(seg_dir)
+            if not is_current(meta, generation):
+                meta = refresh_segment(collection, seg_dir, meta)
+
+    segment = open_segment(seg_dir, meta)
+    _open_segments[collection] = segment
+    return segment
+
+
+# Directory holding a collection's segment files (same hashed name as its partition)
+def segment_dir(collection: str) -> Path:
+    return SEGMENT_DIR / partition_name(collection)
+
+
+# Load meta.json, or None when the segment was never built
+def read_meta(seg_dir: Path) -> dict | None:
+    path = seg_dir / "meta.json"
+    if not path.exists():
+        return None
+    return json.loads(path.read_text())
+
+
+# Write a JSON file atomically (tmp + rename) — concurrent readers never see a partial file
+def write_json(path: Path, data) -> None:
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(json.dumps(data))
+    os.replace(tmp, path)
+
+
+# Segment matches the catalog generation and the configured dimension
+def is_current(meta: dict | None, generation: int) -> bool:
+    return meta is not None and meta["generation"] == generation and meta["dim"] == VECTOR_DIMENSION
+
+
+# Cross-process build lock per collection (readers never take it)
+@contextmanager
+def segment_lock(collection: str):
+    SEGMENT_DIR.mkdir(parents=True, exist_ok=True)
+    with open(SEGMENT_DIR / f".{partition_name(collection)}.lock", "w") as fd:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+
+
+# Append new rows when the collection only grew since the last export and the stored
+# embedding type is unchanged (convert-embeddings rewrites every value, not the row set);
+# otherwise rebuild from scratch. Reads generation + rows from one snapshot.
+def refresh_segment(collection: str, seg_dir: Path, meta: dict | None) -> dict:
+    conn = get_connection(purpose="write")
+    conn.rollback()  # end the implicit transaction register_vector opened; set_session needs none
+    conn.set_session(isolation_level=ISOLATION_LEVEL_REPEATABLE_READ, readonly=True)
+    try:
+        generation = get_generation(conn, collection)
+        with conn.cursor() as cur:
+            storage = embedding_storage(cur)
+        if (meta is not None and meta["dim"] == VECTOR_DIMENSION and meta.get("storage") == storage
+                and only_appended(conn, collection, meta)):
+            truncate_to_meta(seg_dir, meta)
+            meta = export_rows(conn, collection, seg_dir, meta, generation)
+            logging.info(f"Appended segment {collection}: {meta['count']} rows (generation {generation})")
+        else:
+            meta = rebuild_segment(conn, collection, seg_dir, generation, storage)
+            logging.info(f"Rebuilt segment {collection}: {meta['count']} rows from {storage} (generation {generation})")
+        conn.commit()
+    finally:
+        conn.close()
+    return meta
+
+
+# True if every row the segment already holds is still present (no deletes)
+def only_appended(conn, collection: str, meta: dict) -> bool:
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            SELECT COUNT(*) FROM chunk_vectors
+            WHERE collection_id = (SELECT collection_id FROM collections WHERE collection = %s)
+              AND id <= %s AND embedding IS NOT NULL
+            """,
+            (collection, meta["max_id"]),
+        )
+        return cur.fetchone()[0] == meta["count"]
+
+
+# Cut files back to meta.count rows — drops bytes from an interrupted append
+def truncate_to_meta(seg_dir: Path, meta: dict) -> None:
+    count = meta["count"]
+    os.truncate(seg_dir / "vectors.f16", count * meta["dim"] * 2)
+    for name, dtype in _SIDECARS.items():
+        os.truncate(seg_dir / name, count * np.dtype(dtype).itemsize)
+
+
+# Export the full collection into a fresh directory, then swap it in.
+# Readers holding the old memmaps keep working on the unlinked files.
+def rebuild_segment(conn, collection: str, seg_dir: Path, generation: int, storage: str) -> dict:
+    tmp_dir = seg_dir.with_name(f"{seg_dir.name}.tmp{os.getpid()}")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    tmp_dir.mkdir(parents=True)
+    (tmp_dir / "documents.json").write_text("[]")
+    for name in ["vectors.f16", *_SIDECARS]:
+        (tmp_dir / name).touch()
+    empty = {"collection": collection, "generation": generation, "count": 0, "max_id": 0, "dim": VECTOR_DIMENSION,
+             "storage": storage}
+    meta = export_rows(conn, collection, tmp_dir, empty, generation)
+
+    old_dir = seg_dir.with_name(f"{seg_dir.name}.old{os.getpid()}")
+    if seg_dir.exists():
+        seg_dir.rename(old_dir)
+    tmp_dir.rename(seg_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+    return meta
+
+
+# Stream rows with id > meta.max_id through a server-side cursor and append them
+# to the segment files. Returns the new meta (already written).
+def export_rows(conn, collection: str, seg_dir: Path, meta: dict, generation: int) -> dict:
+    documents = json.loads((seg_dir / "documents.json").read_text())
+    doc_codes = {name: code for code, name in enumerate(documents)}
+    count, max_id = meta["count"], meta["max_id"]
+
+    with conn.cursor(name="segment_export") as cur:
+        cur.itersize = EXPORT_BATCH
+        cur.execute(
+            """
+            SELECT v.id, cd.document, d.chunk_index, v.embedding
+            FROM chunk_vectors v
+            JOIN documents d ON d.id = v.id AND d.collection_id = v.collection_id
+            JOIN collection_documents cd ON cd.document_id = v.document_id
+            WHERE v.collection_id = (SELECT collection_id FROM collections WHERE collection = %s)
+              AND v.id > %s AND v.embedding IS NOT NULL
+            ORDER BY v.id
+            """,
+            (collection, max_id),
+        )
+        while True:
+            rows = cur.fetchmany(EXPORT_BATCH)
+            if not rows:
+                break
+            for _, document, _, _ in rows:
+                if document not in doc_codes:
+                    doc_codes[document] = len(documents)
+                    documents.append(document)
+            vectors = normalize(np.stack([to_numpy(r[3]) for r in rows]))
+            append_array(seg_dir / "vectors.f16", vectors.astype(np.float16))
+            append_array(seg_dir / "ids.i8", np.array([r[0] for r in rows], dtype=np.int64))
+            append_array(seg_dir / "chunks.i4", np.array([r[2] for r in rows], dtype=np.int32))
+            append_array(seg_dir / "docs.i4", np.array([doc_codes[r[1]] for r in rows], dtype=np.int32))
+            count += len(rows)
+            max_id = rows[-1][0]
+
+    write_json(seg_dir / "documents.json", documents)
+    meta = {**meta, "generation": generation, "count": count, "max_id": max_id}
+    write_json(seg_dir / "meta.json", meta)  # last: readers size their memmaps from it
+    return meta
+
+
+# Append raw array bytes to a segment file
+def append_array(path: Path, array: np.ndarray) -> None:
+    with open(path, "ab") as f:
+        f.write(np.ascontiguousarray(array).tobytes())
+
+
+# Memory-map a segment's files, sized by meta.count
+def open_segment(seg_dir: Path, meta: dict) -> dict:
+    count, dim = meta["count"], meta["dim"]
+    segment = {"meta": meta, "documents": json.loads((seg_dir / "documents.json").read_text())}
+    if count == 0:
+        segment["vectors"] = np.empty((0, dim), dtype=np.float16)
+        for name, dtype in _SIDECARS.items():
+            segment[name.split(".")[0]] = np.empty(0, dtype=dtype)
+        return segment
+    segment["vectors"] = np.memmap(seg_dir / "vectors.f16", dtype=np.float16, mode="r", shape=(count, dim))
+    for name, dtype in _SIDECARS.items():
+        segment[name.split(".")[0]] = np.memmap(seg_dir / name, dtype=dtype, mode="r", shape=(count,))
+    return segment
+
+
+# pgvector adapter value → float32 array (pgvector>=0.4 returns Vector objects, older ndarrays)
+def to_numpy(value) -> np.ndarray:
+    if hasattr(value, "to_numpy"):
+        value = value.to_numpy()
+    return np.asarray(value, dtype=np.float32)
+
+
+# L2-normalize a vector or the rows of a matrix (zero rows stay zero)
+def normalize(x: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(x, axis=-1, keepdims=True)
+    return x / np.where(norms == 0, 1, norms)
+
+
+# Cosine scores for every row: blockwise float16 → float32 conversion + one sgemv per block.
+# Masked-out rows score -inf.
+def score_segment(segment: dict, query: np.ndarray, mask: np.ndarray | None) -> np.ndarray:
+    vectors = segment["vectors"]
+    scores = np.empty(len(vectors), dtype=np.float32)
+    for start in range(0, len(vectors), SCAN_BLOCK):
+        block = np.asarray(vectors[start:start + SCAN_BLOCK], dtype=np.float32)
+        scores[start:start + len(block)] = block @ query
+    if mask is not None:
+        scores[~mask] = -np.inf
+    return scores
+
+
+# Row indices of the top_k scores, best first (argpartition, then sort only k rows)
+def top_rows(scores: np.ndarray, top_k: int) -> np.ndarray:
+    k = min(top_k, len(scores))
+    if k == 0:
+        return np.empty(0, dtype=np.int64)
+    rows = np.argpartition(-scores, k - 1)[:k]
+    rows = rows[np.argsort(-scores[rows])]
+    return rows[np.isfinite(scores[rows])]
+
+
+# Per-row mask for a document filter — same semantics as db.add_document_filter
+# (LIKE with %/_ wildcards when the value contains %, else exact match)
+def document_mask(segment: dict, document: str) -> np.ndarray:
+    if "%" in document:
+        pattern = re.compile("".join(
+            ".*" if ch == "%" else "." if ch == "_" else re.escape(ch) for ch in document
+        ), re.DOTALL)
+        allowed = np.array([bool(pattern.fullmatch(name)) for name in segment["documents"]], dtype=bool)
+    else:
+        allowed = np.array([name == document for name in segment["documents"]], dtype=bool)
+    if not len(allowed):
+        return np.zeros(len(segment["docs"]), dtype=bool)
+    return allowed[segment["docs"]]
+
+
+# Fetch content for the final hits and shape them like search_vectors results
+def materialize_hits(conn, hits: list[tuple[float, str, int]]) -> list[dict]:
+    by_collection: dict[str, list[int]] = {}
+    for _, collection, chunk_id in hits:
+        by_collection.setdefault(collection, []).append(chunk_id)
+    rows = {}
+    for collection, ids in by_collection.items():
+        for row in fetch_chunks_by_id(conn, collection, ids):
+            rows[(collection, row["id"])] = row
+
+    results = []
+    for score, collection, chunk_id in hits:
+        row = rows.get((collection, chunk_id))
+        if row is None:  # deleted since the segment was synced
+            continue
+        results.append({
+            "content": row["content"],
+            "collection": collection,
+            "document": row["document"],
+            "chunk_index": row["chunk_index"],
+            "score": round(score, 4),
+        })
+    return results
@@ -4,6 +4,7 @@ import logging
 import subprocess
 import time
 from pathlib import Path
+from urllib.parse import urlsplit
 
 import httpx
 
@@ -274,6 +275,13 @@ def stop_all() -> dict[str, str]:
 # class-name strings — the prefix path keeps them working without changes
 # when SERVERS holds multiple variants per class.
 def find_server_url(name: str) -> str | None:
+    state = find_server_state(name)
+    return f"http://localhost:{state['port']}" if state else None
+
+
+# State file (pid, port, model_path, name, ...) of the server find_server_url resolves to:
+# exact preset name first, then the first running variant of a class. None if not running.
+def find_server_state(name: str) -> dict | None:
     states_by_name: dict[str, dict] = {}
     for sf in sorted(TIMESTAMP_DIR.glob("server-port-*.json")):
         try:
@@ -286,18 +294,38 @@ def find_server_url(name: str) -> str | None:
 
     # 1. Exact match
     if name in states_by_name:
-        return f"http://localhost:{states_by_name[name]['port']}"
+        return states_by_name[name]
 
     # 2. Class-prefix fallback: iterate variants in SERVERS insertion order,
     #    return first one that's running.
     variants = _CLASS_MAP.get(name, [])
     for v in variants:
         if v in states_by_name:
-            return f"http://localhost:{states_by_name[v]['port']}"
+            return states_by_name[v]
 
     return None
 
 
+# GGUF stem of the model a client of class `name` talks to, from config and state files only —
+# no network, so cache keys built from it never depend on a server being up. With `url`
+# (EMBEDDING_URL / RERANKER_URL): the server on that local port (its state file, else the
+# preset configured there). Without: the running variant, else the default ensure_ready starts.
+# None when `url` points at no preset — an external server the caller must name itself.
+def served_model(name: str, url: str | None = None) -> str | None:
+    if url:
+        parts = urlsplit(url)
+        if parts.hostname not in ("localhost", "127.0.0.1", "::1"):
+            return None
+        try:
+            return Path(json.loads((TIMESTAMP_DIR / f"server-port-{parts.port}.json").read_text())["model_path"]).stem
+        except (OSError, json.JSONDecodeError, KeyError):
+            pass
+        presets = [p for p in _CLASS_MAP.get(name, []) if SERVERS[p]["default_port"] == parts.port]
+        return Path(SERVERS[presets[0]]["model_path"]).stem if presets else None
+    state = find_server_state(name)
+    return Path(state["model_path"] if state else SERVERS[_resolve_class_to_default(name)]["model_path"]).stem
+
+
 # Check if a server responds; looks up actual port via state file, falls back to default.
 # Accepts preset name OR class name (embedding / reranker / splade) — class falls back to
 # default variant's default_port when nothing is running.
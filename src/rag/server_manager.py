@@ -17,7 +17,7 @@ from .server_utils import (
 from .server_lifecycle import (
     start, stop, restart, start_arbitrary,
     _resolve_class_to_default, start_all, stop_all,
-    find_server_url, check_health, status,
+    find_server_url, find_server_state, served_model, check_health, status,
     _build_llama_cmd, _build_uvicorn_cmd,
 )
 from .watchdog import _ensure_watchdog_process, _watchdog_loop
@@ -140,6 +140,17 @@ for _n, _c in SERVERS.items():
 
 # FUNCTIONS
 
+# Smallest context (-c) among a class's presets, or None if none sets it. With -np 1 that is
+# the most tokens one input (e.g. one text to embed) may have on whichever variant runs.
+def class_context(name: str) -> int | None:
+    sizes = [
+        int(flags[flags.index("-c") + 1])
+        for preset in _CLASS_MAP.get(name, [])
+        if "-c" in (flags := SERVERS[preset].get("extra_flags", []))
+    ]
+    return min(sizes, default=None)
+
+
 # Find the first PID listening on a port; returns None if port is free
 def find_pid_on_port(port: int) -> int | None:
     pids = find_all_pids_on_port(port)
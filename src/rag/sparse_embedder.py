@@ -4,9 +4,9 @@ import os
 from pathlib import Path
 from typing import Union
 
-import httpx
 from dotenv import load_dotenv
 
+from .http_clients import post_json
 from .server_manager import ensure_ready, find_server_url, _touch_state_file
 
 load_dotenv()
@@ -50,11 +50,7 @@ def _sparse_embed_url() -> str:
 def generate_sparse_embeddings(texts: list[str]) -> list[dict]:
     url = _sparse_embed_url()
     _touch_state_file(int(url.split(":")[2].split("/")[0]))
-    response = httpx.post(
-        url,
-        json={"input": texts, "model": "splade"},
-        timeout=300.0
-    )
+    response = post_json("splade", url, {"input": texts, "model": "splade"}, timeout=300.0)
     response.raise_for_status()
     data = response.json()
     return [item["sparse_vector"] for item in data["data"]]
@@ -4,6 +4,7 @@ import time
 from datetime import datetime, timezone
 from pathlib import Path
 
+from .daemon import DAEMON_SOCKET, daemon_running
 from .lock import read as read_lock
 from .server_manager import SERVERS, TIMESTAMP_DIR, status as box_status
 
@@ -11,11 +12,12 @@ from .server_manager import SERVERS, TIMESTAMP_DIR, status as box_status
 # ORCHESTRATOR
 
 def gather() -> dict:
-    """Gather lock state, GPU server health, and Postgres reachability."""
+    """Gather lock state, GPU server health, Postgres reachability, and daemon state."""
     return {
         "lock": _lock_status(),
         "servers": _server_status(),
         "postgres": _postgres_status(),
+        "daemon": daemon_running(),
     }
 
 
@@ -66,6 +68,12 @@ def format_status(info: dict) -> str:
     else:
         lines.append(f"Postgres:  UNREACHABLE (:{pg['port']}) — {pg['error']}")
 
+    # Daemon
+    if info["daemon"]:
+        lines.append(f"Daemon:    RUNNING ({DAEMON_SOCKET})")
+    else:
+        lines.append("Daemon:    STOPPED — cli.py runs in-process")
+
     return "\n".join(lines)
 
 
@@ -43,9 +43,9 @@ from pathlib import Path
 
 from .chunker import chunk_workflow
 from .db import get_connection
-from .embedder import embed_workflow
+from .embedding_cache import embed_cached
 from .indexer import (
-    BATCH_SIZE,
+    EMBED_WINDOW,
     delete_chunks,
     ensure_schema,
     store_chunks,
@@ -315,10 +315,10 @@ def index_file(
         for i, c in enumerate(raw_chunks)
     ]
 
-    for i in range(0, total, BATCH_SIZE):
-        batch = chunks[i:i + BATCH_SIZE]
-        texts = [c["content"] for c in batch]
-        embeddings = embed_workflow(texts, "search_document: ")
-        store_chunks(conn, batch, embeddings)
+    for i in range(0, total, EMBED_WINDOW):
+        window = chunks[i:i + EMBED_WINDOW]
+        texts = [c["content"] for c in window]
+        embeddings = embed_cached(conn, texts, "search_document: ")
+        store_chunks(conn, window, embeddings)
 
     return total
@@ -0,0 +1,90 @@
+# INFRASTRUCTURE
+import logging
+import os
+import threading
+from collections import OrderedDict
+from urllib.parse import urlsplit
+
+import httpx
+
+from .http_clients import post_json
+from .server_manager import find_server_url
+
+# Texts whose token count is remembered (LRU, per process). Keyed by the text itself —
+# chunks and splits are short, and a re-index asks for the same texts again.
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "8192"))
+# Fallback estimate while no embedding server answers /tokenize
+CHARS_PER_TOKEN = 3
+
+_counts: OrderedDict[str, int] = OrderedDict()
+_lock = threading.Lock()
+# Base URLs without a /tokenize endpoint (404/501 — no llama-server behind EMBEDDING_URL) — not asked again
+_unsupported: set[str] = set()
+
+
+# FUNCTIONS
+
+# Token count of text under the embedding model's tokenizer (llama-server /tokenize,
+# no special tokens). Falls back to len/CHARS_PER_TOKEN when no server is reachable;
+# estimates are not cached, so counts become exact once the server is up.
+def count_tokens(text: str) -> int:
+    with _lock:
+        if text in _counts:
+            _counts.move_to_end(text)
+            return _counts[text]
+    tokens = tokenize(text)
+    if tokens is None:
+        return -(-len(text) // CHARS_PER_TOKEN)
+    with _lock:
+        _counts[text] = len(tokens)
+        while len(_counts) > TOKEN_CACHE_SIZE:
+            _counts.popitem(last=False)
+    return len(tokens)
+
+
+# First max_tokens tokens of text, cut at a real token boundary (/detokenize of the
+# kept tokens). Without a server: first max_tokens * CHARS_PER_TOKEN chars.
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    # Every token covers at least one UTF-8 byte — short texts need no round trip;
+    # packed indexing batches already counted (cached) the rest
+    if len(text.encode("utf-8")) <= max_tokens or count_tokens(text) <= max_tokens:
+        return text
+    tokens = tokenize(text)
+    if tokens is None:
+        return text[:max_tokens * CHARS_PER_TOKEN]
+    response = post_json("embedding", f"{_tokenizer_base()}/detokenize", {"tokens": tokens[:max_tokens]}, timeout=60.0)
+    response.raise_for_status()
+    return response.json()["content"]
+
+
+# Token ids of text from the embedding server, or None when it cannot answer. Only a missing
+# endpoint is remembered; a server that is down, warming up (503) or failing answers None for
+# this call and is asked again next time.
+def tokenize(text: str) -> list[int] | None:
+    base = _tokenizer_base()
+    if base is None or base in _unsupported:
+        return None
+    try:
+        response = post_json("embedding", f"{base}/tokenize", {"content": text, "add_special": False}, timeout=60.0)
+        response.raise_for_status()
+        return response.json()["tokens"]
+    except httpx.HTTPStatusError as e:
+        if e.response.status_code in (404, 501):
+            logging.warning(f"No /tokenize at {base}; estimating {CHARS_PER_TOKEN} chars/token")
+            _unsupported.add(base)
+        else:
+            logging.warning(f"Tokenizer error at {base} ({e}); estimating {CHARS_PER_TOKEN} chars/token for this text")
+        return None
+    except (httpx.TransportError, KeyError, ValueError) as e:
+        logging.warning(f"Tokenizer unavailable at {base} ({e}); estimating {CHARS_PER_TOKEN} chars/token for this text")
+        return None
+
+
+# Base URL of the embedding server (same model, so same tokenizer): EMBEDDING_URL's
+# scheme + host, else state-file discovery. None if no server is running.
+def _tokenizer_base() -> str | None:
+    env = os.getenv("EMBEDDING_URL")
+    if env:
+        parts = urlsplit(env)
+        return f"{parts.scheme}://{parts.netloc}"
+    return find_server_url("embedding")
@@ -0,0 +1,25 @@
+# Tests that touch PostgreSQL run only against a dedicated database, never the POSTGRES_DB
+# of .env:  RAG_TEST_POSTGRES_DB=rag_pytest python -m pytest -q
+import os
+
+import pytest
+
+TEST_DB = os.getenv("RAG_TEST_POSTGRES_DB")
+if TEST_DB:
+    # Before src.rag.db is imported — it reads POSTGRES_DB once (load_dotenv does not override)
+    os.environ["POSTGRES_DB"] = TEST_DB
+
+
+# Connection to the test database with the schema in place; skips without one
+@pytest.fixture
+def db_conn():
+    if not TEST_DB:
+        pytest.skip("RAG_TEST_POSTGRES_DB not set")
+    from src.rag.db import get_connection
+    from src.rag.indexer import ensure_schema
+
+    conn = get_connection(purpose="ddl")
+    ensure_schema(conn)
+    yield conn
+    conn.rollback()
+    conn.close()
@@ -0,0 +1,34 @@
+import pytest
+
+from src.rag import embedder
+
+
+# embed_packed with count_tokens, the server start and the request stubbed: returns the
+# token count of every input (text + BOS/EOS) per request it would send
+@pytest.fixture
+def packed_requests(monkeypatch):
+    requests = []
+    monkeypatch.setattr(embedder, "ensure_ready", lambda name: None)
+    monkeypatch.setattr(embedder, "count_tokens", lambda text: len(text.split()))
+    monkeypatch.setattr(embedder, "EMBEDDING_CONTEXT", 2048)
+    monkeypatch.setattr(embedder, "EMBED_BATCH_TOKENS", 4096)
+
+    def embed_workflow(texts, prefix=None):
+        requests.append([len(t.split()) + embedder.SPECIAL_TOKENS for t in texts])
+        return [None] * len(texts)
+
+    monkeypatch.setattr(embedder, "embed_workflow", embed_workflow)
+    return requests
+
+
+# Four 1022-token texts fill the 4096-token budget exactly once BOS/EOS are counted
+def test_embed_packed_fills_budget_exactly(packed_requests):
+    embedder.embed_packed(["w " * 1022] * 4)
+    assert packed_requests == [[1024] * 4]
+
+
+# One token more each and the four no longer fit one request — without BOS/EOS they would (4092)
+def test_embed_packed_counts_special_tokens(packed_requests):
+    embedder.embed_packed(["w " * 1023] * 4)
+    assert all(sum(request) <= embedder.EMBED_BATCH_TOKENS for request in packed_requests)
+    assert sorted(map(len, packed_requests)) == [1, 3]
@@ -0,0 +1,27 @@
+import numpy as np
+
+from src.rag.indexer import VECTOR_DIMENSION, delete_collection, store_chunks
+from src.rag.search_primitives import search_sparse
+
+COLLECTION = "pytest_search_sparse"
+
+
+# Fewer backfilled chunks than top_k: only they come back, best first — the NULL rows
+# (not backfilled) must neither fill the LIMIT nor reach the score conversion
+def test_search_sparse_skips_chunks_without_sparse_vector(db_conn):
+    chunks = [
+        {"collection": COLLECTION, "document": "doc.md", "content": f"chunk {i}", "chunk_index": i, "total_chunks": 6}
+        for i in range(6)
+    ]
+    embeddings = [np.ones(VECTOR_DIMENSION, dtype=np.float32)] * len(chunks)
+    sparse = [{"indices": [7], "values": [float(i + 1)]} if i % 3 == 0 else None for i in range(len(chunks))]
+    delete_collection(db_conn, COLLECTION)
+    store_chunks(db_conn, chunks, embeddings, sparse)
+    try:
+        results = search_sparse(db_conn, {"indices": [7], "values": [1.0]}, 10, COLLECTION)
+    finally:
+        db_conn.rollback()
+        delete_collection(db_conn, COLLECTION)
+
+    assert [r["chunk_index"] for r in results] == [3, 0]
+    assert [r["score"] for r in results] == [4.0, 1.0]
@@ -13,7 +13,9 @@ from src.rag.indexer import (
     doc_is_complete,
     ensure_schema,
     index_json_workflow,
+    load_chunks_json,
 )
+from src.rag.pipeline import index_pipeline
 from src.rag.retriever import search_workflow
 from src.rag.sync import (
     compute_hash,
@@ -173,15 +175,26 @@ def main(command: str, **kwargs) -> None:
             ensure_ready("index")
             print("Servers ready.")
 
-            total_chunks = 0
-            for i, (md_file, document, current) in enumerate(to_index):
-                raw_chunks = chunk_workflow(str(md_file), chunk_size, overlap)
-                json_path = _write_chunks_json(md_file, raw_chunks, collection, document)
-                n = index_json_workflow(str(json_path))
-                upsert_hash(conn, collection, document, current)
-                total_chunks += n
-                update_progress(done=i + 1, total=len(to_index), current_document=document)
-                print(f"  Indexed {document} -> {n} chunks (sidecar: {json_path.name})")
+            # Chunking (producer thread), embedding and writing overlap across files;
+            # each file is committed, hashed and reported in order.
+            hashes = {document: current for _, document, current in to_index}
+            sidecars: dict[str, Path] = {}
+            done: list[int] = []
+
+            def _chunked():
+                for md_file, document, _ in to_index:
+                    raw_chunks = chunk_workflow(str(md_file), chunk_size, overlap)
+                    sidecars[document] = _write_chunks_json(md_file, raw_chunks, collection, document)
+                    yield document, load_chunks_json(sidecars[document])
+
+            def _indexed(document: str, n: int, _total: int) -> None:
+                upsert_hash(conn, collection, document, hashes[document])
+                done.append(n)
+                update_progress(done=len(done), total=len(to_index), current_document=document)
+                print(f"  Indexed {document} -> {n} chunks (sidecar: {sidecars[document].name})")
+
+            index_pipeline(_chunked(), on_document=_indexed)
+            total_chunks = sum(done)
 
             conn.close()
             _stop_hb.set()
@@ -242,6 +255,37 @@ def main(command: str, **kwargs) -> None:
             conn.close()
             print(f"  Indexed -> {n} chunks (sidecar: {json_path.name})")
 
+    elif command == "sync-segments":
+        from src.rag.segment_store import sync_segments_workflow
+        for seg in sync_segments_workflow(kwargs.get("collection")):
+            print(f"{seg['collection']}: {seg['chunks']} chunks (generation {seg['generation']})")
+
+    elif command == "rebuild-catalog":
+        from src.rag.indexer import rebuild_catalog_workflow
+        print(f"Catalog rebuilt: {rebuild_catalog_workflow()} documents")
+
+    elif command == "build-ann-index":
+        from src.rag.indexer import build_ann_index_workflow
+        print(f"ANN index built ({build_ann_index_workflow()} rows backfilled)")
+
+    elif command == "convert-embeddings":
+        from src.rag.indexer import EMBEDDING_STORAGE, convert_embeddings_workflow
+        print(f"Converted {convert_embeddings_workflow()} embeddings to {EMBEDDING_STORAGE}")
+
+    elif command == "migrate-legacy":
+        from src.rag.indexer import migrate_legacy_workflow
+        print(f"Migrated {migrate_legacy_workflow()} legacy chunks")
+
+    elif command == "build-ivfpq":
+        from src.rag.ivfpq import IVF_M, build_ivfpq_workflow
+        built = build_ivfpq_workflow(
+            kwargs["collection"],
+            nlist=kwargs.get("nlist"),
+            m=kwargs.get("m") or IVF_M,
+            retrain=kwargs.get("retrain", False),
+        )
+        print(f"{built['collection']}: {built['chunks']} chunks, nlist={built['nlist']}, m={built['m']} (generation {built['generation']})")
+
     elif command == "server":
         from src.rag.server_manager import cli_server
         cli_server(kwargs.get("server_args", []))
@@ -262,8 +306,8 @@ if __name__ == "__main__":
 
     chunk_parser = subparsers.add_parser("chunk", help="Chunk markdown into JSON")
     chunk_parser.add_argument("--input", required=True, help="Path to markdown file")
-    chunk_parser.add_argument("--chunk-size", type=int, default=2000, help="Target chunk size in chars")
-    chunk_parser.add_argument("--overlap", type=int, default=400, help="Overlap between chunks in chars")
+    chunk_parser.add_argument("--chunk-size", type=int, default=2000, help="Target chunk size in chars (tokens with CHUNK_UNIT=tokens)")
+    chunk_parser.add_argument("--overlap", type=int, default=400, help="Overlap between chunks in chars (tokens with CHUNK_UNIT=tokens)")
     chunk_parser.add_argument("--document", help="Document name (default: input filename)")
 
     backfill_parser = subparsers.add_parser("backfill-splade", help="Backfill SPLADE sparse embeddings")
@@ -276,17 +320,34 @@ if __name__ == "__main__":
     index_dir_parser = subparsers.add_parser("index-dir", help="Chunk + index all .md files in a directory (skip-by-default via indexed_files hash)")
     index_dir_parser.add_argument("--input", required=True, help="Path to directory with .md files")
     index_dir_parser.add_argument("--collection", help="Override collection name (default: directory name)")
-    index_dir_parser.add_argument("--chunk-size", type=int, default=2000, help="Target chunk size in chars")
-    index_dir_parser.add_argument("--overlap", type=int, default=400, help="Overlap between chunks in chars")
+    index_dir_parser.add_argument("--chunk-size", type=int, default=2000, help="Target chunk size in chars (tokens with CHUNK_UNIT=tokens)")
+    index_dir_parser.add_argument("--overlap", type=int, default=400, help="Overlap between chunks in chars (tokens with CHUNK_UNIT=tokens)")
     index_dir_parser.add_argument("--force", action="store_true", help="Bypass skip-logic, re-embed every file (use only when embedding model or chunker changed)")
 
     index_file_parser = subparsers.add_parser("index-file", help="Chunk + index a single .md file (skip-by-default via indexed_files hash)")
     index_file_parser.add_argument("--input", required=True, help="Path to .md file")
     index_file_parser.add_argument("--collection", help="Override collection name (default: parent folder name)")
-    index_file_parser.add_argument("--chunk-size", type=int, default=2000, help="Target chunk size in chars")
-    index_file_parser.add_argument("--overlap", type=int, default=400, help="Overlap between chunks in chars")
+    index_file_parser.add_argument("--chunk-size", type=int, default=2000, help="Target chunk size in chars (tokens with CHUNK_UNIT=tokens)")
+    index_file_parser.add_argument("--overlap", type=int, default=400, help="Overlap between chunks in chars (tokens with CHUNK_UNIT=tokens)")
     index_file_parser.add_argument("--force", action="store_true", help="Bypass skip-logic, re-embed even if hash matches")
 
+    segments_parser = subparsers.add_parser("sync-segments", help="Export/refresh memory-mapped float16 segments for DENSE_SEARCH_MODE=numpy/ivfpq and re-encode stale IVF-PQ indexes")
+    segments_parser.add_argument("--collection", help="Only this collection (default: all)")
+
+    subparsers.add_parser("rebuild-catalog", help="Recompute collection/document chunk counts from the documents table")
+
+    subparsers.add_parser("build-ann-index", help="Backfill embedding_mrl (+ embedding_bin with BINARY_QUANTIZATION=1) and build the MRL HNSW index per partition, online")
+
+    subparsers.add_parser("convert-embeddings", help="Convert stored dense embeddings to EMBEDDING_STORAGE (vector/halfvec) in batches")
+
+    subparsers.add_parser("migrate-legacy", help="Move a name-keyed documents table into the dictionary-encoded partitioned tables in batches, online")
+
+    ivfpq_parser = subparsers.add_parser("build-ivfpq", help="Train + encode the IVF-PQ index for DENSE_SEARCH_MODE=ivfpq")
+    ivfpq_parser.add_argument("--collection", required=True, help="Collection to index")
+    ivfpq_parser.add_argument("--nlist", type=int, help="Coarse lists (default: ~4*sqrt(chunks), max 4096)")
+    ivfpq_parser.add_argument("--m", type=int, help="PQ sub-quantizers (default: IVF_M)")
+    ivfpq_parser.add_argument("--retrain", action="store_true", help="Retrain centroids/codebooks instead of re-encoding with the existing ones")
+
     server_parser = subparsers.add_parser("server", help="Manage GPU servers (status/start/stop/restart)")
     server_parser.add_argument("server_args", nargs="*", default=["status"], help="action [server_name]")
 